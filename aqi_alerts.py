@@ -0,0 +1,318 @@
+"""Alert rules evaluated over every station and city on each data refresh.
+
+Rules are rows of a table (RULES, or a JSON list loaded with load_rules):
+
+- kind 'above' fires while AQI exceeds threshold; kind 'rise' fires while
+  AQI rose by at least threshold since the previous refresh;
+- for_refreshes is the debounce: the condition must hold on that many
+  consecutive refreshes before the alert fires;
+- repeat_after is how many seconds a firing alert stays quiet before it is
+  sent again; 0 sends it only when it starts;
+- rules sharing a group are tiers of one condition, and only the most
+  severe tier that fires is reported for an entity (a city at AQI 350 gets
+  the hazardous alert, not the unhealthy one as well).
+
+The default tiers are the ones behind the dashboard's mask recommendation
+and health advisory. AlertEngine keeps the debounce and firing state of
+every (entity, rule) pair as NumPy arrays, so a refresh is a handful of
+array operations whatever the number of stations, and hands the alerts
+that started, repeated or resolved to a sink, such as WebhookSink.
+
+    python aqi_alerts.py bench --stations 100000
+    python aqi_alerts.py stub --port 8766
+
+bench evaluates synthetic refreshes against a local webhook stub; stub
+serves one and prints what it receives. The dashboard evaluates the rules
+once per hourly refresh and posts to AQI_ALERT_WEBHOOK when it is set, with
+the rules of AQI_ALERT_RULES (a JSON file) or RULES.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from aqi_data import HEALTH_ADVISORIES
+
+SEVERITIES = ['info', 'warning', 'critical']
+RULES = pd.DataFrame({
+    'name': ['unhealthy', 'very_unhealthy', 'hazardous', 'rapid_rise'],
+    'kind': ['above', 'above', 'above', 'rise'],
+    'threshold': [100.0, 200.0, 300.0, 50.0],
+    'for_refreshes': [2, 1, 1, 1],
+    'repeat_after': [0.0, 6 * 3600.0, 3600.0, 0.0],
+    'group': ['level', 'level', 'level', 'rise'],
+    'severity': ['info', 'warning', 'critical', 'warning'],
+    'message': [HEALTH_ADVISORIES['title'][1], HEALTH_ADVISORIES['title'][2], HEALTH_ADVISORIES['title'][3],
+                'AQI rising fast'],
+})
+ALERT_WEBHOOK = os.environ.get('AQI_ALERT_WEBHOOK')
+ALERT_RULES_PATH = os.environ.get('AQI_ALERT_RULES')
+RULE_DEFAULTS = {'for_refreshes': 1, 'repeat_after': 0.0, 'severity': 'warning', 'message': ''}
+
+def load_rules(path):
+    """Rules from a JSON list of objects with at least name, kind and threshold"""
+    with open(path, encoding='utf-8') as f:
+        rules = pd.DataFrame(json.load(f))
+    return validate_rules(rules)
+
+def validate_rules(rules):
+    """Rules with defaults filled in; raises ValueError on an unknown kind or severity"""
+    rules = rules.copy()
+    for column, default in RULE_DEFAULTS.items():
+        rules[column] = rules[column].fillna(default) if column in rules else default
+    if 'group' not in rules:
+        rules['group'] = rules['name']
+    rules['group'] = rules['group'].fillna(rules['name'])
+    unknown = set(rules['kind']) - {'above', 'rise'}
+    if unknown:
+        raise ValueError(f"Unknown rule kind(s) {sorted(unknown)}; expected 'above' or 'rise'")
+    unknown = set(rules['severity']) - set(SEVERITIES)
+    if unknown:
+        raise ValueError(f"Unknown severity {sorted(unknown)}; expected one of {SEVERITIES}")
+    # Within a group, later columns are the more severe tiers
+    rules['rank'] = rules['severity'].map(SEVERITIES.index)
+    return rules.sort_values(['group', 'rank', 'threshold'], kind='stable', ignore_index=True)
+
+class AlertEngine:
+    """Debounced, deduplicated alerts of a rule table over a changing set of entities.
+
+    evaluate() takes one refresh: a DataFrame indexed by a unique entity id
+    with an 'aqi' column and, for rise rules, a 'previous' column (NaN where
+    unknown); any other columns (kind, name, city) are copied into the
+    alerts. sink is a callable taking the DataFrame of alerts to send.
+    """
+
+    def __init__(self, rules=RULES, sink=None, send_resolved=True):
+        self.rules = validate_rules(rules)
+        self.sink = sink
+        self.send_resolved = send_resolved
+        self.key = None
+        self._ids = pd.Index([])
+        n_rules = len(self.rules)
+        self._streak = np.zeros((0, n_rules), dtype=np.int32)
+        self._active = np.zeros((0, n_rules), dtype=bool)
+        self._sent = np.zeros((0, n_rules))
+        self._lock = threading.Lock()
+
+        groups = self.rules['group'].to_numpy()
+        self._same_group = groups[:, None] == groups[None, :]
+        # higher[i, j]: rule j is a more severe tier of rule i's group
+        self._higher = self._same_group & (np.arange(n_rules)[:, None] < np.arange(n_rules))
+
+    def _align(self, ids):
+        """Carry the state of entities seen before over to this refresh's entity order"""
+        if self._ids.equals(ids):
+            return
+        old = self._ids.get_indexer(ids)
+        known = old >= 0
+        for name in ('_streak', '_active', '_sent'):
+            state = getattr(self, name)
+            aligned = np.zeros((len(ids), state.shape[1]), dtype=state.dtype)
+            aligned[known] = state[old[known]]
+            setattr(self, name, aligned)
+        self._ids = ids
+
+    def conditions(self, entities):
+        """(entities, rules) boolean array of the rule conditions that hold this refresh"""
+        aqi = entities['aqi'].to_numpy(dtype=float)[:, None]
+        previous = (entities['previous'].to_numpy(dtype=float)[:, None] if 'previous' in entities
+                    else np.full_like(aqi, np.nan))
+        threshold = self.rules['threshold'].to_numpy(dtype=float)
+        rise = (self.rules['kind'] == 'rise').to_numpy()
+        with np.errstate(invalid='ignore'):
+            value = np.where(rise, aqi - previous, aqi)
+            return np.where(rise, value >= threshold, value > threshold)
+
+    def evaluate(self, entities, now=None, key=None):
+        """Update the state with one refresh and send the alerts that started, repeated or resolved.
+
+        key identifies the refresh: a refresh whose key matches the last one
+        evaluated is skipped and returns no alerts, so evaluating the same
+        data again never advances the debounce.
+        """
+        now = time.time() if now is None else now
+        if not entities.index.is_unique:
+            raise ValueError("Entity ids must be unique")
+        with self._lock:
+            if key is not None and key == self.key:
+                return self._alerts(entities, {}, now)
+            self.key = key
+            self._align(entities.index)
+            holds = self.conditions(entities)
+            self._streak = np.where(holds, self._streak + 1, 0)
+            firing = self._streak >= self.rules['for_refreshes'].to_numpy()
+            firing &= ~(firing[:, None, :] & self._higher).any(axis=2)
+
+            started = firing & ~self._active
+            repeat_after = self.rules['repeat_after'].to_numpy(dtype=float)
+            repeated = firing & self._active & (repeat_after > 0) & (now - self._sent >= repeat_after)
+            # A tier replaced by another one of its group is not resolved; the group is when none fires
+            group_firing = (firing[:, None, :] & self._same_group).any(axis=2)
+            resolved = self._active & ~group_firing if self.send_resolved else np.zeros_like(firing)
+            self._sent = np.where(started | repeated, now, self._sent)
+            self._active = firing
+
+        alerts = self._alerts(entities, {'firing': started | repeated, 'resolved': resolved}, now)
+        if self.sink is not None and len(alerts):
+            self.sink(alerts)
+        return alerts
+
+    def _alerts(self, entities, masks, now):
+        parts = []
+        for status, mask in masks.items():
+            rows, rules = np.nonzero(mask)
+            if not len(rows):
+                continue
+            part = entities.iloc[rows].reset_index(names='id')
+            rule = self.rules.iloc[rules]
+            part.insert(1, 'rule', rule['name'].to_numpy())
+            part.insert(2, 'status', status)
+            part['severity'] = rule['severity'].to_numpy()
+            part['message'] = rule['message'].to_numpy()
+            parts.append(part)
+        if not parts:
+            return pd.DataFrame(columns=['id', 'rule', 'status', 'severity', 'message', 'time'])
+        alerts = pd.concat(parts, ignore_index=True)
+        alerts['time'] = pd.Timestamp(now, unit='s').isoformat(timespec='seconds')
+        return alerts
+
+    def active(self):
+        """DataFrame (id, rule) of the alerts firing after the last refresh"""
+        with self._lock:
+            rows, rules = np.nonzero(self._active)
+            return pd.DataFrame({'id': self._ids[rows], 'rule': self.rules['name'].to_numpy()[rules]})
+
+def alert_entities(stations, cities=None, city_aqi=None, city_previous=None):
+    """One refresh's entities: every station, and optionally every city with its current and previous AQI"""
+    frames = [pd.DataFrame({
+        'kind': 'station', 'name': stations['name'].astype(str).to_numpy(),
+        'city': stations['city'].astype(str).to_numpy(), 'aqi': stations['aqi'].to_numpy(dtype=float),
+        'previous': stations['previous'].to_numpy(dtype=float) if 'previous' in stations else np.nan,
+    }, index='station:' + stations['city'].astype(str).to_numpy() + '/' + stations['name'].astype(str).to_numpy())]
+    if cities is not None:
+        frames.append(pd.DataFrame({
+            'kind': 'city', 'name': cities.index.to_numpy(dtype=str), 'city': cities.index.to_numpy(dtype=str),
+            'aqi': np.asarray(city_aqi, dtype=float),
+            'previous': np.nan if city_previous is None else np.asarray(city_previous, dtype=float),
+        }, index='city:' + cities.index.to_numpy(dtype=str)))
+    entities = pd.concat(frames)
+    return entities[~entities.index.duplicated()]
+
+class WebhookSink:
+    """POSTs alerts as JSON ({"alerts": [...]}) in batches, retrying failed requests.
+
+    Failures are counted in stats rather than raised, so a webhook outage
+    never breaks a data refresh.
+    """
+
+    def __init__(self, url, batch_size=500, timeout=10.0, retries=2, backoff=0.5):
+        self.url = url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    def __call__(self, alerts):
+        for start in range(0, len(alerts), self.batch_size):
+            batch = alerts.iloc[start:start + self.batch_size]
+            body = json.dumps({'alerts': json.loads(batch.to_json(orient='records'))}).encode()
+            self._post(body, len(batch))
+
+    def _post(self, body, count):
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        for attempt in range(self.retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    self.stats['sent'] += count
+                    return
+            except OSError:
+                if attempt < self.retries:
+                    self.stats['retried'] += 1
+                    time.sleep(self.backoff * 2 ** attempt)
+        self.stats['failed'] += count
+
+def webhook_stub(port=0):
+    """Local webhook receiver in a background thread; returns the server and the list of payloads it got"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+def synthetic_refreshes(n_stations, refreshes, seed=0):
+    """Station frames of consecutive hourly refreshes with drifting AQI and occasional spikes"""
+    rng = np.random.default_rng(seed)
+    aqi = rng.gamma(2.0, 60.0, n_stations)
+    stations = pd.DataFrame({'name': [f'S{i:06d}' for i in range(n_stations)],
+                             'city': [f'City {i % 500}' for i in range(n_stations)]})
+    for _ in range(refreshes):
+        previous = aqi
+        aqi = np.clip(aqi * rng.normal(1, 0.08, n_stations) + (rng.random(n_stations) < 0.01) * 80, 0, 500)
+        yield stations.assign(aqi=aqi.round(), previous=previous.round())
+
+def _bench(args):
+    server, received = webhook_stub()
+    sink = WebhookSink(f'http://127.0.0.1:{server.server_port}/alerts')
+    engine = AlertEngine()
+    refreshes = list(synthetic_refreshes(args.stations, args.refreshes))
+    try:
+        for i, stations in enumerate(refreshes):
+            started = time.perf_counter()
+            entities = alert_entities(stations)
+            prepared = time.perf_counter()
+            alerts = engine.evaluate(entities, now=i * 3600.0)
+            evaluated = time.perf_counter()
+            sink(alerts)
+            counts = alerts['status'].value_counts().to_dict()
+            print(f"refresh {i}: {len(entities)} entities, {counts.get('firing', 0)} firing / "
+                  f"{counts.get('resolved', 0)} resolved; frame {prepared - started:.3f}s, "
+                  f"rules {evaluated - prepared:.3f}s, sink {time.perf_counter() - evaluated:.3f}s")
+    finally:
+        server.shutdown()
+    print(f"stub received {sum(len(payload['alerts']) for payload in received)} alerts "
+          f"in {len(received)} requests; sink {sink.stats}")
+
+def _stub(args):
+    server, received = webhook_stub(args.port)
+    print(f"Webhook stub on http://127.0.0.1:{server.server_port}/alerts")
+    seen = 0
+    try:
+        while True:
+            time.sleep(1)
+            for payload in received[seen:]:
+                for alert in payload['alerts']:
+                    print(f"{alert['time']} {alert['status']:<8} {alert['severity']:<8} {alert['id']}: "
+                          f"{alert['rule']} (AQI {alert['aqi']:.0f})")
+            seen = len(received)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    bench = commands.add_parser('bench', help='evaluate synthetic refreshes against a local webhook stub')
+    bench.add_argument('--stations', type=int, default=100000)
+    bench.add_argument('--refreshes', type=int, default=5)
+    stub = commands.add_parser('stub', help='serve a webhook stub and print the alerts it receives')
+    stub.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args(argv)
+    {'bench': _bench, 'stub': _stub}[args.command](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""Read-only JSON API serving the dashboard's numbers to apps and partners.
+
+The API is built on the same data layer as aqi_dash and shows the same
+numbers: current AQI and headline metrics, the 24-hour series, the pollutant
+breakdown, the global ranking and the hotspots of each city.
+
+    GET /v1/cities                     every city's headline metrics (?city=... to pick some)
+    GET /v1/cities/{city}              one city's metrics and health advisory
+    GET /v1/cities/{city}/24h          hourly AQI and pollutants of the day
+    GET /v1/cities/{city}/pollutants   current concentrations and sub-indices
+    GET /v1/cities/{city}/hotspots     stations within HOTSPOT_RADIUS_KM, worst first
+    GET /v1/comparison                 ranking of every city and station, most polluted first
+                                       (?kind=city|station, region, country, order=clean, page, size)
+
+The data changes once an hour, so every response is encoded once per hour
+(JSON, gzip and its ETag) and then served from memory to every client. The
+responses carry ETag, Last-Modified (the start of the hour) and a max-age
+up to the next refresh, and revalidations with If-None-Match or
+If-Modified-Since are answered 304 without a body. Responses are served
+from memory on the event loop; building one (pandas work and, for the
+ranking, a refresh of the shared aqi_rank.Ranking) runs on the default
+executor so a miss never stalls other clients:
+
+    python aqi_api.py serve --port 8503
+    python aqi_api.py bench --clients 2 --duration 10
+
+bench starts a server process and load-generator processes against it and
+reports the request rate and latency.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+
+import numpy as np
+import pandas as pd
+from aiohttp import ClientSession, TCPConnector, web
+
+from aqi_compute import POLLUTANTS, sub_indices
+from aqi_data import (AQI_STANDARD, CITY_REGISTRY_PATH, DATA_SOURCE, HOTSPOT_RADIUS_KM, DataCache, SnapshotHolder,
+                      build_snapshot, city_metrics, classify_aqi, health_advisory, hour_bucket, load_city_registry,
+                      mask_recommendation, readings_frame, station_catalogue, time_bucket)
+from aqi_rank import Ranking, location_ids, ranking_locations
+
+API_PORT = int(os.environ.get('AQI_API_PORT', 8503))
+API_CACHE_ENTRIES = 8192
+GZIP_MIN_BYTES = 512
+GZIP_LEVEL = 6
+RANKING_PAGE_SIZE = 25
+RANKING_MAX_PAGE_SIZE = 500
+
+class ApiResponse:
+    """A JSON payload encoded once per data refresh, with its gzip body and validators"""
+    __slots__ = ('body', 'gzipped', 'etag', 'last_modified', 'modified', 'expires')
+
+    def __init__(self, payload, modified, expires):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+        self.gzipped = gzip.compress(self.body, GZIP_LEVEL) if len(self.body) >= GZIP_MIN_BYTES else None
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=12).hexdigest()}"'
+        self.modified = int(modified)
+        self.last_modified = formatdate(self.modified, usegmt=True)
+        self.expires = expires
+
+    def not_modified(self, headers):
+        """Whether a request's validators match, so it can be answered 304"""
+        if 'If-None-Match' in headers:
+            return any(tag.strip().removeprefix('W/') in (self.etag, '*')
+                       for tag in headers['If-None-Match'].split(','))
+        if 'If-Modified-Since' in headers:
+            try:
+                return parsedate_to_datetime(headers['If-Modified-Since']).timestamp() >= self.modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+def _records(frame):
+    """Rows of a DataFrame as JSON-ready dicts, with NaN as null and float32 values at float32 precision"""
+    narrow = frame.select_dtypes('float32').columns
+    frame = frame.astype(dict.fromkeys(narrow, str)).astype(dict.fromkeys(narrow, float))
+    return json.loads(frame.to_json(orient='records', date_format='iso', force_ascii=False))
+
+class AqiApi:
+    """Request handlers over one city registry, sharing a snapshot and a response cache"""
+
+    def __init__(self, cities, source=DATA_SOURCE):
+        self.cities = cities
+        self.source = source
+        self.cache = DataCache(ttl=3600, max_entries=API_CACHE_ENTRIES)
+        self.snapshots = SnapshotHolder(lambda key: build_snapshot(cities, key[1], key[0]))
+        self.stations, self.station_index = station_catalogue(cities, source)
+        self.ranking = Ranking(ranking_locations(cities, self.stations))
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/v1/cities', self._endpoint(self.cities_payload))
+        app.router.add_get('/v1/cities/{city}', self._endpoint(self.city_payload))
+        app.router.add_get('/v1/cities/{city}/24h', self._endpoint(self.series_payload))
+        app.router.add_get('/v1/cities/{city}/pollutants', self._endpoint(self.pollutants_payload))
+        app.router.add_get('/v1/cities/{city}/hotspots', self._endpoint(self.hotspots_payload))
+        app.router.add_get('/v1/comparison', self._endpoint(self.comparison_payload))
+        return app
+
+    def _endpoint(self, payload):
+        """Handler answering from the response cache, keyed by URL and data refresh"""
+        async def handle(request):
+            now = datetime.now()
+            bucket = hour_bucket(now)
+            key = ('response', request.path_qs, self.source, bucket)
+            response = self.cache.get(key)
+            if response is None:
+                # Building a response is pandas work; keep it off the event loop
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, self._respond, key, payload, request, now)
+            headers = {
+                'ETag': response.etag,
+                'Last-Modified': response.last_modified,
+                'Cache-Control': f'public, max-age={max(int(response.expires - time.time()), 0)}',
+                'Vary': 'Accept-Encoding',
+            }
+            if response.not_modified(request.headers):
+                return web.Response(status=304, headers=headers)
+            body = response.body
+            if response.gzipped is not None and 'gzip' in request.headers.get('Accept-Encoding', ''):
+                body = response.gzipped
+                headers['Content-Encoding'] = 'gzip'
+            return web.Response(body=body, content_type='application/json', charset='utf-8', headers=headers)
+        return handle
+
+    def _respond(self, key, payload, request, now):
+        """The response for key, built and cached on a miss.
+
+        Just after midnight, while one request builds the new day's snapshot,
+        the others are answered from the previous one: those responses are
+        neither cached under the new hour nor cacheable by clients.
+        """
+        if self.snapshot(now).key == (self.source, time_bucket(now)):
+            return self.cache.get_or_compute(key, lambda: self._encode(payload, request, now))
+        return self._encode(payload, request, now, expires=time.time())
+
+    def _encode(self, payload, request, now, expires=None):
+        modified = datetime.strptime(hour_bucket(now), '%Y-%m-%d %H')
+        city = request.match_info.get('city')
+        if city is not None and city not in self.cities.index:
+            raise web.HTTPNotFound(text=json.dumps({'error': f'Unknown city {city!r}'}),
+                                   content_type='application/json')
+        body = {'time': modified.isoformat(), 'standard': AQI_STANDARD, **payload(request, now)}
+        return ApiResponse(body, modified.timestamp(), modified.timestamp() + 3600 if expires is None else expires)
+
+    def metrics(self, now):
+        """Headline metrics of every city for the current hour, shared by the city endpoints"""
+        snapshot = self.snapshot(now)
+        return self.cache.get_or_compute(('metrics', snapshot.key, now.hour), lambda: city_metrics(
+            self.cities, snapshot.readings, now.hour, self.stations, self.station_index))
+
+    def snapshot(self, now):
+        return self.snapshots.get((self.source, time_bucket(now)))
+
+    def cities_payload(self, request, now):
+        metrics = self.metrics(now)
+        selected = request.query.getall('city', [])
+        if selected:
+            metrics = metrics.loc[metrics.index.intersection(selected, sort=False)]
+        return {'cities': _records(metrics.rename_axis('city').reset_index())}
+
+    def city_payload(self, request, now):
+        city = request.match_info['city']
+        row = _records(self.metrics(now).loc[[city]].rename_axis('city').reset_index())[0]
+        current = self._day(city, now).loc[[now.hour], POLLUTANTS]
+        row['description'] = classify_aqi([row['current_aqi']])['Description'].iloc[0]
+        row['dominant_pollutant'] = sub_indices(current, AQI_STANDARD).idxmax(axis=1).iloc[0]
+        advisory = health_advisory(row['current_aqi'])
+        row['advisory'] = {'level': advisory['level'], 'title': advisory['title'], 'advice': list(advisory['advice'])}
+        return row
+
+    def series_payload(self, request, now):
+        city = request.match_info['city']
+        day = self._day(city, now).rename(columns={'Hour': 'time', 'AQI': 'aqi'})
+        return {'city': city, 'date': time_bucket(now), 'current_hour': now.hour, 'hours': _records(day)}
+
+    def pollutants_payload(self, request, now):
+        city = request.match_info['city']
+        current = self._day(city, now).loc[[now.hour], POLLUTANTS]
+        indices = sub_indices(current.astype(float), AQI_STANDARD).iloc[0].round(1)
+        return {
+            'city': city,
+            'hour': f'{now.hour:02d}:00',
+            'concentrations': _records(current)[0],
+            'sub_indices': _records(indices.to_frame().T)[0],
+            'dominant_pollutant': indices.idxmax(),
+        }
+
+    def hotspots_payload(self, request, now):
+        city = request.match_info['city']
+        info = self.cities.loc[city]
+        rows, distances = self.station_index.within(info['lat'], info['lon'], HOTSPOT_RADIUS_KM)
+        hotspots = self.stations.iloc[rows][['name', 'lat', 'lon', 'aqi', 'zone']].assign(
+            distance_km=np.round(distances, 2)).sort_values('aqi', ascending=False)
+        hotspots['status'] = classify_aqi(hotspots['aqi'])['Status'].to_numpy()
+        payload = {'city': city, 'radius_km': HOTSPOT_RADIUS_KM, 'hotspots': _records(hotspots)}
+        if len(hotspots):
+            mask = mask_recommendation(hotspots['aqi'].max())
+            payload['mask'] = {'mask': mask['mask'], 'urgency': mask['urgency'], 'description': mask['description']}
+        return payload
+
+    def comparison_payload(self, request, now):
+        query = request.query
+        try:
+            page = int(query.get('page', 1)) - 1
+            size = int(query.get('size', RANKING_PAGE_SIZE))
+        except ValueError:
+            raise _bad_request("page and size must be integers")
+        kind = query.get('kind')
+        if page < 0 or not 0 < size <= RANKING_MAX_PAGE_SIZE:
+            raise _bad_request(f"page must be at least 1 and size between 1 and {RANKING_MAX_PAGE_SIZE}")
+        if kind not in (None, 'city', 'station'):
+            raise _bad_request(f"Unknown kind {kind!r}; expected 'city' or 'station'")
+        filters = {'kind': kind, 'region': query.get('region'), 'country': query.get('country')}
+        ascending = query.get('order') == 'clean'
+
+        # The same ranking the dashboard shows: every city at this hour and every station
+        snapshot = self.snapshot(now)
+        if self.ranking.key != (snapshot.key, now.hour):
+            self.ranking.update(pd.Series(snapshot.readings[:, now.hour, 0],
+                                          index=location_ids('city', self.cities.index)),
+                                key=(snapshot.key, now.hour))
+        summary = self.ranking.summary(**filters)
+        rows = self.ranking.page(page, size, ascending, **filters).reset_index()
+        rows['status'] = classify_aqi(rows['aqi'])['Status'].astype(str).to_numpy()
+        for extreme in ('highest', 'lowest'):
+            if summary[extreme] is not None:
+                summary[extreme] = dict(zip(('label', 'aqi'), summary[extreme]))
+        return {
+            'page': page + 1,
+            'pages': -(-summary['count'] // size),
+            'summary': {**summary, 'average': None if np.isnan(summary['average']) else summary['average']},
+            'locations': _records(rows.astype({column: str for column in ('kind', 'city', 'country', 'region')})),
+        }
+
+    def _day(self, city, now):
+        """The city's 24-hour DataFrame, as the dashboard builds it"""
+        snapshot = self.snapshot(now)
+        return self.cache.get_or_compute(('24h', snapshot.key, city), lambda: readings_frame(
+            snapshot.readings[self.cities.index.get_loc(city)], snapshot.key[1]))
+
+def _bad_request(message):
+    return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+def serve(port=API_PORT, cities=CITY_REGISTRY_PATH, source=DATA_SOURCE, host='0.0.0.0'):
+    web.run_app(AqiApi(load_city_registry(cities), source).app(), host=host, port=port, access_log=None,
+                print=None)
+
+def _serve(args):
+    print(f"AQI API on http://localhost:{args.port}/v1/cities")
+    serve(args.port, args.cities, args.source)
+
+BENCH_MIX = [('/v1/cities/{city}', 50), ('/v1/cities/{city}/24h', 20), ('/v1/cities/{city}/pollutants', 10),
+             ('/v1/cities/{city}/hotspots', 10), ('/v1/cities', 5), ('/v1/comparison', 5)]
+
+async def _load(base_url, cities, duration, connections, revalidate, seed):
+    """Requests from `connections` concurrent loops for duration seconds; returns (statuses, latencies)"""
+    rng = random.Random(seed)
+    paths, weights = zip(*BENCH_MIX)
+    statuses, latencies, etags = {}, [], {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(session):
+        while time.perf_counter() < deadline:
+            url = base_url + rng.choices(paths, weights)[0].format(city=rng.choice(cities))
+            headers = {'Accept-Encoding': 'gzip'}
+            if url in etags and rng.random() < revalidate:
+                headers['If-None-Match'] = etags[url]
+            started = time.perf_counter()
+            async with session.get(url, headers=headers) as response:
+                await response.read()
+                etags[url] = response.headers.get('ETag', '')
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    async with ClientSession(connector=TCPConnector(limit=connections)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(connections)))
+    return statuses, latencies
+
+def _load_process(args):
+    return asyncio.run(_load(*args))
+
+def _wait_for(url, timeout=30):
+    async def poll():
+        deadline = time.perf_counter() + timeout
+        async with ClientSession() as session:
+            while True:
+                try:
+                    async with session.get(url) as response:
+                        return response.status
+                except OSError:
+                    if time.perf_counter() > deadline:
+                        raise
+                    await asyncio.sleep(0.2)
+    return asyncio.run(poll())
+
+def _bench(args):
+    cities = list(load_city_registry(args.cities).index)
+    server = multiprocessing.Process(target=serve, args=(args.port, args.cities, args.source, '127.0.0.1'),
+                                     daemon=True)
+    server.start()
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        _wait_for(base_url + '/v1/comparison')
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(_load_process, [(base_url, cities, args.duration, args.connections,
+                                                args.revalidate, seed) for seed in range(args.clients)])
+    finally:
+        server.terminate()
+    statuses = {}
+    for counts, _ in results:
+        for status, count in counts.items():
+            statuses[status] = statuses.get(status, 0) + count
+    latencies = np.concatenate([latency for _, latency in results]) * 1e3
+    print(f"{len(latencies)} requests in {args.duration:.0f}s: {len(latencies) / args.duration:.0f} req/s "
+          f"from {args.clients} client processes x {args.connections} connections; "
+          f"p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms; "
+          f"statuses {dict(sorted(statuses.items()))}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', default=CITY_REGISTRY_PATH, help='city registry, CSV or Parquet')
+    parser.add_argument('--source', default=DATA_SOURCE, help='data source name (default $AQI_DATA_SOURCE)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('serve', 'serve the API'), ('bench', 'load-test a local API server')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--port', type=int, default=API_PORT)
+    bench = commands.choices['bench']
+    bench.add_argument('--clients', type=int, default=2, help='load generator processes')
+    bench.add_argument('--connections', type=int, default=32, help='concurrent connections per client')
+    bench.add_argument('--duration', type=float, default=10.0, help='seconds')
+    bench.add_argument('--revalidate', type=float, default=0.5,
+                       help='share of repeat requests sent with If-None-Match')
+
+    args = parser.parse_args(argv)
+    {'serve': _serve, 'bench': _bench}[args.command](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""Benchmarks of the dashboard's data, classification, search, figure and page costs.
+
+Every benchmark runs once per combination of the scaling parameters it
+uses (cities, hours, hotspots), and reports the minimum and median of
+--repeat timed runs after one untimed warm-up:
+
+- readings: simulated readings for cities x hours plus one city's frame,
+  the work behind generate_24h_data;
+- history: day rollups and their statistics for cities x hours, the work
+  that replaced generate_monthly_data;
+- classify / aqi_status: classify_aqi and get_aqi_status over cities x hours
+  AQI values;
+- search_index / search: building the city search index over a catalogue of
+  `cities` names, and a fixed set of queries against it;
+- ranking: an hourly update of every city, the first page, a filtered page
+  from the middle and a summary of the global ranking over `locations`
+  cities and stations;
+- one benchmark per aqi_charts builder, each building the figure and
+  serialising it to JSON as st.plotly_chart does;
+- page: a headless run of aqi_dash.py through Streamlit's AppTest in a fresh
+  process (first and warm render) with `page-cities` extra cities added to
+  the registry and a prewarmed reading store;
+- sessions: the memory each additional session holds once the shared
+  snapshot and caches exist, measured with tracemalloc while `sessions`
+  AppTest sessions are kept alive in one process.
+
+Results are written as JSON together with the commit they were measured at;
+--compare reports the change against an earlier results file and exits with
+status 1 when any benchmark got slower than --threshold:
+
+    python aqi_bench.py --cities 100 1000 10000 --output bench.json
+    python aqi_bench.py --only search page --compare bench.json
+"""
+import argparse
+import atexit
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import aqi_charts
+import aqi_data
+from aqi_compute import POLLUTANTS
+from aqi_data import (CITY_REGISTRY_PATH, CitySearchIndex, classify_aqi, get_aqi_status,
+                      readings_frame, readings_long_frame, simulate_readings, synthetic_stations)
+from aqi_forecast import forecast, forecast_frame
+from aqi_rank import COUNTRY_REGIONS, Ranking, location_ids, ranking_locations
+from aqi_rollup import aggregate, stats
+
+SCALES = {'cities': [100, 1000, 5000], 'hours': [24, 24 * 7, 24 * 30], 'hotspots': [30, 1000, 30000],
+          'locations': [1000, 100000], 'page_cities': [0], 'sessions': [50]}
+SEARCH_QUERIES = ['del', 'new york', 'sao paulo', 'ton', 'india', 'xqzv']
+START = pd.Timestamp('2024-01-01')
+
+BENCHMARKS = {}
+
+def benchmark(*scales):
+    """Register a benchmark: a setup function of the given scales returning the callable to time"""
+    def register(setup):
+        BENCHMARKS[setup.__name__] = (setup, scales)
+        return setup
+    return register
+
+def _rng():
+    return np.random.default_rng(0)
+
+def _city_names(n, rng):
+    """n distinct made-up city names of two or three syllables"""
+    syllables = np.array(['ka', 'lo', 'mi', 'san', 'tor', 'ba', 'del', 'ri', 'vo', 'ne', 'shi', 'ya', 'par', 'um'])
+    parts = rng.choice(syllables, size=(n, 3))
+    lengths = rng.integers(2, 4, n)
+    return [''.join(row[:length]).title() + f' {i}' for i, (row, length) in enumerate(zip(parts, lengths))]
+
+def _aqi(cities, hours):
+    return _rng().uniform(0, 500, cities * hours).round()
+
+def _day(hours):
+    """One city's readings over `hours` hours, in the dashboard's 24-hour frame layout"""
+    return readings_frame(simulate_readings([180], n_hours=hours, rng=_rng())[0], START)
+
+def _figure(build):
+    return lambda: build().to_json()
+
+@benchmark('cities', 'hours')
+def readings(cities, hours):
+    base = _rng().uniform(20, 400, cities)
+    return lambda: readings_frame(simulate_readings(base, n_hours=hours, rng=_rng())[0], START)
+
+@benchmark('cities', 'hours')
+def history(cities, hours):
+    frame = readings_long_frame(simulate_readings(_rng().uniform(20, 400, cities), n_hours=hours, rng=_rng()),
+                                [f'city {i}' for i in range(cities)], START)
+    return lambda: stats(aggregate(frame, 'day'))
+
+@benchmark('cities', 'hours')
+def classify(cities, hours):
+    values = _aqi(cities, hours)
+    return lambda: classify_aqi(values)
+
+@benchmark('cities', 'hours')
+def aqi_status(cities, hours):
+    values = _aqi(cities, hours)
+    return lambda: get_aqi_status(values)
+
+@benchmark('cities')
+def search_index(cities):
+    names = _city_names(cities, _rng())
+    countries = _rng().choice(['India', 'China', 'United States', 'Brazil', 'France'], cities)
+    return lambda: CitySearchIndex(names, countries)
+
+@benchmark('cities')
+def search(cities):
+    index = search_index(cities)()
+    return lambda: [index.search(query) for query in SEARCH_QUERIES]
+
+@benchmark('locations')
+def ranking(locations):
+    rng = _rng()
+    n_cities = max(1, locations // 10)
+    names = _city_names(n_cities, rng)
+    cities = pd.DataFrame({'country': rng.choice(list(COUNTRY_REGIONS), n_cities), 'flag': '',
+                           'base_aqi': rng.integers(20, 450, n_cities)}, index=names)
+    stations = pd.DataFrame({'name': [f'S{i}' for i in range(locations - n_cities)],
+                             'city': np.resize(names, locations - n_cities),
+                             'aqi': rng.integers(20, 450, locations - n_cities)})
+    ranking = Ranking(ranking_locations(cities, stations))
+    hourly = pd.Series(0.0, index=location_ids('city', names))
+
+    def run():
+        started = time.perf_counter()
+        ranking.update(hourly.add(rng.integers(20, 450, n_cities)))
+        updated = time.perf_counter()
+        ranking.page(0, 25)
+        first = time.perf_counter()
+        ranking.page(len(ranking.positions(region='Asia')) // 50, 25, region='Asia')
+        middle = time.perf_counter()
+        ranking.summary(region='Europe', kind='station')
+        return {'update': updated - started, 'first_page': first - updated, 'middle_page': middle - first,
+                'summary': time.perf_counter() - middle}
+    return run
+
+@benchmark('hours')
+def trend_figure(hours):
+    df = _day(hours)
+    history = df['AQI'].to_numpy(dtype=float)[None, -14 * 24:]
+    df_forecast = forecast_frame(['city'], START + pd.Timedelta(hours=hours), forecast(history, 72))
+    return _figure(lambda: aqi_charts.trend_figure(df, hours - 1, df_forecast))
+
+@benchmark('hours')
+def distribution_figure(hours):
+    df = _day(hours)
+    return _figure(lambda: aqi_charts.distribution_figure(df['AQI']))
+
+@benchmark()
+def pollutant_radar_figure():
+    current = _day(24).loc[12, POLLUTANTS].tolist()
+    return _figure(lambda: aqi_charts.pollutant_radar_figure(POLLUTANTS, current))
+
+@benchmark('hours')
+def pollutant_trend_figure(hours):
+    df = _day(hours)
+    return _figure(lambda: aqi_charts.pollutant_trend_figure(df))
+
+@benchmark('cities')
+def comparison_figure(cities):
+    aqi = _rng().integers(20, 450, cities)
+    status = classify_aqi(aqi)
+    df = pd.DataFrame({'City': _city_names(cities, _rng()), 'AQI': aqi, 'Color': status['Color'].astype(str)})
+    return _figure(lambda: aqi_charts.comparison_figure(df.sort_values('AQI', ascending=False)))
+
+@benchmark('hours')
+def history_figure(hours):
+    frame = readings_long_frame(simulate_readings(_rng().uniform(20, 400, 5), n_hours=hours, rng=_rng()),
+                                [f'city {i}' for i in range(5)], START)
+    df_history = stats(aggregate(frame, 'hour'))
+    return _figure(lambda: aqi_charts.history_figure(df_history, 'hour'))
+
+@benchmark('hotspots')
+def hotspot_map_figure(hotspots):
+    city = pd.DataFrame({'lat': [28.61], 'lon': [77.21], 'base_aqi': [300]}, index=['Delhi'])
+    stations = synthetic_stations(city, per_city=hotspots, radius_km=25, rng=_rng())
+    return _figure(lambda: aqi_charts.hotspot_map_figure(stations, 28.61, 77.21))
+
+PAGE_WORKER = r'''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+timings = {}
+for run in ('first_render', 'warm_render'):
+    started = time.perf_counter()
+    app.run()
+    timings[run] = time.perf_counter() - started
+if app.exception:
+    sys.exit(f"page raised: {app.exception[0].message}")
+print(json.dumps(timings))
+'''
+
+SESSIONS_WORKER = r'''
+import gc, json, sys, tracemalloc
+from streamlit.testing.v1 import AppTest
+
+def session():
+    app = AppTest.from_file(sys.argv[1], default_timeout=600)
+    app.run()
+    if app.exception:
+        sys.exit(f"page raised: {app.exception[0].message}")
+    return app
+
+first = session()    # builds the shared snapshot, caches and figures
+gc.collect()
+tracemalloc.start()
+before = tracemalloc.get_traced_memory()[0]
+sessions = [session() for _ in range(int(sys.argv[2]))]
+gc.collect()
+held = tracemalloc.get_traced_memory()[0] - before
+print(json.dumps({'session_bytes': held / len(sessions)}))
+'''
+
+def _page_env(page_cities):
+    """Environment for a dashboard process with the shipped cities plus page_cities made-up ones,
+    and its own reading store prewarmed to now"""
+    workdir = Path(tempfile.mkdtemp(prefix='aqi_bench_'))
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    registry = pd.read_csv(CITY_REGISTRY_PATH, encoding='utf-8')
+    rng = _rng()
+    extra = pd.DataFrame({
+        'name': _city_names(page_cities, rng), 'country': 'Benchland', 'flag': '🏳️',
+        'base_aqi': rng.integers(20, 450, page_cities),
+        'lat': rng.uniform(-60, 70, page_cities).round(4), 'lon': rng.uniform(-180, 180, page_cities).round(4),
+    })
+    pd.concat([registry, extra], ignore_index=True).to_csv(workdir / 'cities.csv', index=False)
+    aqi_data.main(['--cities', str(workdir / 'cities.csv'), 'prewarm', '--data-dir', str(workdir / 'data')])
+    return dict(os.environ, AQI_CITY_REGISTRY=str(workdir / 'cities.csv'), AQI_DATA_DIR=str(workdir / 'data'))
+
+def _worker(code, env, *args):
+    """Callable running a worker script against aqi_dash.py in a fresh process; returns its JSON output"""
+    script = Path(__file__).with_name('aqi_dash.py')
+
+    def run():
+        process = subprocess.run([sys.executable, '-c', code, str(script), *map(str, args)], env=env,
+                                 cwd=script.parent, capture_output=True, text=True)
+        if process.returncode:
+            raise RuntimeError(f"worker failed:\n{process.stderr[-2000:]}")
+        return json.loads(process.stdout.splitlines()[-1])
+    return run
+
+@benchmark('page_cities')
+def page(page_cities):
+    return _worker(PAGE_WORKER, _page_env(page_cities))
+
+@benchmark('sessions')
+def sessions(sessions):
+    return _worker(SESSIONS_WORKER, _page_env(0), sessions)
+
+def run_benchmark(name, params, repeat):
+    """Timing rows of one benchmark at one set of parameters.
+
+    A benchmark whose callable returns a dict of measurements (page,
+    sessions) reports each of them as name.key instead of its own wall
+    time; keys ending in _bytes are memory, in bytes.
+    """
+    setup, _ = BENCHMARKS[name]
+    target = setup(**params)
+    target()
+    samples = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = target()
+        elapsed = time.perf_counter() - started
+        timings = result if isinstance(result, dict) else {None: elapsed}
+        for key, value in timings.items():
+            samples.setdefault(f"{name}.{key}" if key else name, []).append(value)
+    return [{'name': row_name, 'params': params, 'repeat': repeat,
+             'unit': 'bytes' if row_name.endswith('_bytes') else 'seconds',
+             'min': min(times), 'median': statistics.median(times), 'times': times}
+            for row_name, times in samples.items()]
+
+def environment():
+    """Commit, interpreter and machine the results were measured on"""
+    def git(*args):
+        process = subprocess.run(['git', *args], capture_output=True, text=True, cwd=Path(__file__).parent)
+        return process.stdout.strip() if process.returncode == 0 else None
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+def _key(row):
+    return row['name'], json.dumps(row['params'], sort_keys=True)
+
+def compare(results, baseline, threshold):
+    """Print the median change of every benchmark found in both runs; return the regressed ones"""
+    before = {_key(row): row for row in baseline['results']}
+    regressed = []
+    print(f"\nagainst {baseline['environment'].get('commit') or 'baseline'} (threshold +{threshold:.0%}):")
+    for row in results:
+        old = before.get(_key(row))
+        if old is None:
+            continue
+        change = row['median'] / old['median'] - 1
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"  {_label(row):<48}{_format(row, old['median'])} ->{_format(row, row['median'])}  {change:+7.1%}{flag}")
+        if flag:
+            regressed.append(row)
+    return regressed
+
+def _format(row, value):
+    if row.get('unit') == 'bytes':
+        return f"{value / 1e3:10.1f} kB"
+    return f"{value * 1e3:10.2f} ms"
+
+def _label(row):
+    params = ' '.join(f"{key}={value}" for key, value in row['params'].items())
+    return f"{row['name']} {params}".strip()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run (default all)')
+    for scale, default in SCALES.items():
+        parser.add_argument(f"--{scale.replace('_', '-')}", type=int, nargs='+', default=default, dest=scale)
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--output', '-o', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='median slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        _, scales = BENCHMARKS[name]
+        for values in itertools.product(*(getattr(args, scale) for scale in scales)):
+            rows = run_benchmark(name, dict(zip(scales, values)), args.repeat)
+            for row in rows:
+                print(f"{_label(row):<48}{_format(row, row['min'])} min {_format(row, row['median'])} median",
+                      flush=True)
+            results.extend(rows)
+
+    report = {'environment': environment(), 'results': results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=1))
+    if args.compare:
+        regressed = compare(results, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
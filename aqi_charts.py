@@ -0,0 +1,257 @@
+"""Plotly figure builders of the dashboard.
+
+Each builder takes the data of one chart and returns a go.Figure, with no
+Streamlit calls, so the dashboard only places the figures and the builders
+can be timed or reused on their own. Time-series traces go through
+chart_points() so no trace sends more than CHART_MAX_POINTS points.
+"""
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+
+from aqi_data import AQI_CATEGORIES, classify_aqi
+from aqi_downsample import downsample
+from aqi_geo import cell_size_for_zoom, grid_clusters
+
+# Building a figure imports plotly.tools, which imports IPython.core.display whenever IPython is
+# installed: about 0.45 s, a third of a cold first render. These figures are only ever sent out as JSON.
+try:
+    from _plotly_utils.optional_imports import _not_importable
+    _not_importable.add('IPython.core.display')
+except ImportError:
+    pass
+
+CHART_MAX_POINTS = int(os.environ.get('AQI_CHART_MAX_POINTS', 1000))
+FORECAST_CHART_HOURS = 24
+MAP_ZOOM = 10
+MAP_MAX_MARKERS = 300
+SAFE_LIMITS = [60, 100, 80, 80, 4, 100]
+TREND_POLLUTANTS = {'PM2.5': '#ef4444', 'PM10': '#f97316', 'NO2': '#fbbf24', 'SO2': '#a855f7'}
+HISTORY_COLORS = ['#ef4444', '#f97316', '#10b981', '#3b82f6', '#a855f7', '#eab308', '#06b6d4', '#ec4899']
+DARK_LAYOUT = dict(
+    template='plotly_dark',
+    plot_bgcolor='rgba(15, 23, 42, 0.8)',
+    paper_bgcolor='rgba(30, 41, 59, 0.8)',
+)
+
+def chart_points(df, x, y, max_points=CHART_MAX_POINTS):
+    """Rows of df to plot as one x/y trace: at most max_points, keeping its shape and peaks"""
+    return df.iloc[downsample(df[x], df[y], max_points)]
+
+def trend_figure(df_24h, current_hour, df_forecast):
+    """Observed AQI up to current_hour, then the forecast line and its 80% band"""
+    fig = go.Figure()
+    # Hours after the current one are covered by the forecast instead
+    df_trace = chart_points(df_24h.loc[:current_hour], 'Hour', 'AQI')
+    fig.add_trace(go.Scatter(
+        x=df_trace['Hour'],
+        y=df_trace['AQI'],
+        mode='lines',
+        name='AQI',
+        fill='tozeroy',
+        line=dict(color='#3b82f6', width=3),
+        fillcolor='rgba(59, 130, 246, 0.2)'
+    ))
+    df_forecast = df_forecast.iloc[:FORECAST_CHART_HOURS]
+    fig.add_trace(go.Scatter(
+        x=np.concatenate([df_forecast['time'], df_forecast['time'][::-1]]),
+        y=np.concatenate([df_forecast['upper'], df_forecast['lower'][::-1]]).round(),
+        fill='toself',
+        fillcolor='rgba(168, 85, 247, 0.2)',
+        line=dict(width=0),
+        hoverinfo='skip',
+        name='Forecast range (80%)'
+    ))
+    fig.add_trace(go.Scatter(
+        x=df_forecast['time'],
+        y=df_forecast['mean'].round(),
+        mode='lines',
+        name='Forecast',
+        line=dict(color='#a855f7', width=2, dash='dash')
+    ))
+    fig.update_layout(
+        **DARK_LAYOUT,
+        height=400,
+        xaxis_title='Time',
+        yaxis_title='AQI Value',
+        hovermode='x unified',
+    )
+    return fig
+
+def distribution_figure(aqi):
+    """Donut of the hours spent in each AQI category"""
+    cat_counts = classify_aqi(aqi)['Status'].value_counts()
+    cat_counts = cat_counts[cat_counts > 0]
+    colors_map = AQI_CATEGORIES.set_index('status')['color']
+
+    fig = go.Figure(data=[go.Pie(
+        labels=cat_counts.index,
+        values=cat_counts.values,
+        hole=0.4,
+        marker=dict(colors=[colors_map[cat] for cat in cat_counts.index])
+    )])
+    fig.update_layout(**DARK_LAYOUT, height=400, showlegend=True)
+    return fig
+
+def pollutant_radar_figure(pollutants, current_values, safe_limits=SAFE_LIMITS):
+    """Current pollutant levels against their safe limits"""
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=current_values,
+        theta=pollutants,
+        fill='toself',
+        name='Current Level',
+        line=dict(color='#06b6d4', width=2)
+    ))
+    fig.add_trace(go.Scatterpolar(
+        r=safe_limits,
+        theta=pollutants,
+        fill='toself',
+        name='Safe Limit',
+        line=dict(color='#10b981', width=2),
+        opacity=0.3
+    ))
+    fig.update_layout(
+        **DARK_LAYOUT,
+        polar=dict(
+            radialaxis=dict(visible=True, range=[0, max(max(current_values), max(safe_limits))])
+        ),
+        showlegend=True,
+        height=400,
+    )
+    return fig
+
+def pollutant_trend_figure(df_24h, pollutants=TREND_POLLUTANTS):
+    """One line per pollutant over the day"""
+    fig = go.Figure()
+    for pollutant, color in pollutants.items():
+        df_trace = chart_points(df_24h, 'Hour', pollutant)
+        fig.add_trace(go.Scatter(
+            x=df_trace['Hour'],
+            y=df_trace[pollutant],
+            mode='lines',
+            name=pollutant,
+            line=dict(color=color, width=2)
+        ))
+
+    fig.update_layout(
+        **DARK_LAYOUT,
+        height=400,
+        xaxis_title='Time',
+        yaxis_title='Concentration (µg/m³)',
+        hovermode='x unified',
+    )
+    return fig
+
+def comparison_figure(df_comparison):
+    """Bars of City/AQI, coloured by each row's Color"""
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=df_comparison['City'],
+        y=df_comparison['AQI'],
+        marker=dict(
+            color=df_comparison['Color'].astype(str),
+            line=dict(color='rgba(255,255,255,0.3)', width=1)
+        ),
+        text=df_comparison['AQI'],
+        textposition='outside'
+    ))
+
+    fig.update_layout(
+        **DARK_LAYOUT,
+        height=500,
+        xaxis_title='Cities',
+        yaxis_title='AQI Value',
+        showlegend=False,
+    )
+    return fig
+
+def history_figure(df_history, level, names=None):
+    """Mean AQI per city and rollup bucket, with min, max and p95 on hover.
+
+    names maps a city to its legend label; cities missing from it use their name.
+    """
+    names = names or {}
+    fig = go.Figure()
+    for i, (city, df_city) in enumerate(df_history.groupby('city', sort=False)):
+        df_city = chart_points(df_city, 'start', 'mean')
+        fig.add_trace(go.Scatter(
+            x=df_city['start'],
+            y=df_city['mean'].round(),
+            mode='lines',
+            name=names.get(city, city),
+            line=dict(color=HISTORY_COLORS[i % len(HISTORY_COLORS)], width=2),
+            customdata=df_city[['min', 'max', 'p95']].round().to_numpy(),
+            hovertemplate="%{y:.0f} (min %{customdata[0]:.0f}, max %{customdata[1]:.0f}, "
+                          "p95 %{customdata[2]:.0f})",
+        ))
+
+    fig.update_layout(
+        **DARK_LAYOUT,
+        height=500,
+        xaxis_title='Date',
+        yaxis_title=f'Mean AQI per {level}',
+        hovermode='x unified',
+    )
+    return fig
+
+def cluster_hotspots(hotspots, zoom=MAP_ZOOM, max_markers=MAP_MAX_MARKERS):
+    """Markers to draw for a set of hotspots, with a station count per marker.
+
+    Up to max_markers hotspots are drawn individually. Beyond that they are
+    merged into grid cells about 40 px wide at the given zoom; each cluster
+    sits at its stations' mean position and shows its worst station.
+    """
+    if len(hotspots) <= max_markers:
+        return hotspots.assign(count=1)
+
+    labels = grid_clusters(hotspots['lat'], hotspots['lon'], cell_size_for_zoom(zoom))
+    ranked = hotspots.assign(cluster=labels).sort_values('aqi', ascending=False)
+    grouped = ranked.groupby('cluster', sort=False)
+    clusters = grouped[['name', 'aqi', 'zone']].first()
+    clusters['lat'] = grouped['lat'].mean()
+    clusters['lon'] = grouped['lon'].mean()
+    clusters['count'] = grouped.size()
+    return clusters.reset_index(drop=True)
+
+def hotspot_map_figure(hotspots, center_lat, center_lon, zoom=MAP_ZOOM):
+    """Hotspot map as a single array-backed marker trace"""
+    markers = cluster_hotspots(hotspots, zoom)
+    status = classify_aqi(markers['aqi'])
+    clustered = bool((markers['count'] > 1).any())
+
+    labels = markers['name'].astype(str).where(
+        markers['count'] == 1, markers['name'].astype(str) + ' +' + (markers['count'] - 1).astype(str) + ' nearby')
+    hovertemplate = ("<b>%{customdata[0]}</b><br>AQI: %{customdata[1]}<br>"
+                     "Status: %{customdata[2]}<br>Zone Type: %{customdata[3]}<br>")
+    if clustered:
+        hovertemplate += "Stations: %{customdata[4]}<br>"
+
+    fig = go.Figure(go.Scattermapbox(
+        lat=markers['lat'],
+        lon=markers['lon'],
+        mode='markers' if clustered else 'markers+text',
+        marker=dict(
+            size=15 + markers['aqi'] / 20 + 4 * np.log2(markers['count']),
+            color=status['Color'].astype(str),
+            opacity=0.8,
+            sizemode='diameter'
+        ),
+        text=None if clustered else labels + '<br>AQI: ' + markers['aqi'].astype(str),
+        customdata=np.column_stack([labels, markers['aqi'], status['Status'].astype(str),
+                                    markers['zone'].astype(str), markers['count']]),
+        hovertemplate=hovertemplate + "<extra></extra>",
+    ))
+    fig.update_layout(
+        mapbox=dict(
+            style="carto-darkmatter",
+            center=dict(lat=center_lat, lon=center_lon),
+            zoom=zoom
+        ),
+        showlegend=False,
+        height=500,
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor='rgba(30, 41, 59, 0.8)',
+    )
+    return fig
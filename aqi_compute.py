@@ -0,0 +1,165 @@
+"""AQI computation from raw pollutant concentrations.
+
+Each pollutant's concentration is mapped to a sub-index by linear
+interpolation between the breakpoints of an AQI standard, and the AQI is the
+highest sub-index (the dominant pollutant). Everything works on whole arrays
+or DataFrames, so a batch of hourly readings for thousands of stations is a
+handful of NumPy calls per pollutant.
+
+Concentrations are expected in µg/m³, except CO in mg/m³.
+"""
+import numpy as np
+import pandas as pd
+
+POLLUTANTS = ['PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'O3']
+# In-memory dtypes of hourly readings: AQI stays well inside int16 and
+# concentrations carry one decimal, so neither needs 64 bits
+READING_DTYPES = {'AQI': 'int16', **dict.fromkeys(POLLUTANTS, 'float32')}
+
+# For each standard: the AQI value at every breakpoint, and per pollutant the
+# concentration at those breakpoints (in the standard's own units), the
+# averaging window in hours and the factor converting µg/m³ (mg/m³ for CO)
+# into those units. Concentrations above the last breakpoint cap at the top
+# of the scale.
+STANDARDS = {
+    'IN': {
+        'name': 'India NAQI (CPCB)',
+        'index': [0, 50, 100, 200, 300, 400, 500],
+        'pollutants': {
+            'PM2.5': ([0, 30, 60, 90, 120, 250, 380], 24, 1.0),
+            'PM10': ([0, 50, 100, 250, 350, 430, 510], 24, 1.0),
+            'NO2': ([0, 40, 80, 180, 280, 400, 520], 24, 1.0),
+            'SO2': ([0, 40, 80, 380, 800, 1600, 2400], 24, 1.0),
+            'CO': ([0, 1.0, 2.0, 10, 17, 34, 51], 8, 1.0),
+            'O3': ([0, 50, 100, 168, 208, 748, 1288], 8, 1.0),
+        },
+        'min_pollutants': 3,
+    },
+    'US': {
+        'name': 'US EPA',
+        'index': [0, 50, 100, 150, 200, 300, 500],
+        'pollutants': {
+            'PM2.5': ([0, 9.0, 35.4, 55.4, 125.4, 225.4, 325.4], 24, 1.0),
+            'PM10': ([0, 54, 154, 254, 354, 424, 604], 24, 1.0),
+            'NO2': ([0, 53, 100, 360, 649, 1249, 2049], 1, 24.45 / 46.01),    # ppb
+            'SO2': ([0, 35, 75, 185, 304, 604, 1004], 1, 24.45 / 64.07),      # ppb
+            'CO': ([0, 4.4, 9.4, 12.4, 15.4, 30.4, 50.4], 8, 24.45 / 28.01),  # ppm
+            'O3': ([0, 54, 70, 85, 105, 200, 604], 8, 24.45 / 48.00),         # ppb, top band from the 1 h table
+        },
+        'min_pollutants': 1,
+    },
+}
+
+def sub_index(concentration, pollutant, standard='IN'):
+    """Sub-index for an array of one pollutant's concentrations"""
+    breakpoints, _, scale = STANDARDS[standard]['pollutants'][pollutant]
+    values = np.asarray(concentration, dtype=float) * scale
+    return np.interp(values, breakpoints, STANDARDS[standard]['index'])
+
+def sub_indices(concentrations, standard='IN'):
+    """Sub-index of every known pollutant column in a DataFrame"""
+    known = [p for p in concentrations.columns if p in STANDARDS[standard]['pollutants']]
+    return pd.DataFrame({p: sub_index(concentrations[p], p, standard) for p in known},
+                        index=concentrations.index)
+
+def aqi_from_array(concentrations, pollutants, standard='IN'):
+    """AQI for an array whose last axis holds the given pollutants, in order.
+
+    Returns integer AQI values (-1 where too few pollutants are available)
+    with the shape of the input minus its last axis.
+    """
+    concentrations = np.asarray(concentrations, dtype=float)
+    indices = np.stack([sub_index(concentrations[..., i], p, standard)
+                        for i, p in enumerate(pollutants)], axis=-1)
+    return _combine(indices, STANDARDS[standard]['min_pollutants'])
+
+def _combine(indices, min_pollutants):
+    available = ~np.isnan(indices)
+    aqi = np.rint(np.nanmax(np.where(available, indices, -1), axis=-1)).astype(int)
+    aqi[available.sum(axis=-1) < min_pollutants] = -1
+    return aqi
+
+def rolling_concentrations(readings, standard='IN', time='time', station=None, min_coverage=0.75):
+    """Average each pollutant over the standard's window (24 h for PM, 8 h for CO/O3, ...).
+
+    readings holds at most one row per station and hour, with a datetime
+    column `time`. Windows are trailing and time-based, so missing hours count
+    against coverage; windows with less than min_coverage of their hours
+    present are NaN. All stations are averaged together with cumulative sums
+    over a (station, hour) sort key rather than a per-station loop.
+    """
+    frame = readings.sort_values([station, time] if station else time)
+    hour = frame[time].to_numpy().astype('datetime64[h]').astype(np.int64)
+    key = hour - hour.min() if len(hour) else hour
+    if station:
+        codes = pd.factorize(frame[station])[0].astype(np.int64)
+        key = codes * (key.max() + 48) + key
+
+    averaged = frame[[c for c in (station, time) if c]].copy()
+    for pollutant, (_, hours, _) in STANDARDS[standard]['pollutants'].items():
+        if pollutant not in frame.columns:
+            continue
+        values = frame[pollutant].to_numpy(dtype=float)
+        if hours == 1:
+            averaged[pollutant] = values
+            continue
+
+        valid = ~np.isnan(values)
+        sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+        counts = np.concatenate([[0], np.cumsum(valid)])
+        start = np.searchsorted(key, key - hours + 1, side='left')
+        end = np.arange(1, len(key) + 1)
+
+        present = counts[end] - counts[start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (sums[end] - sums[start]) / present
+        mean[present < max(1, int(np.ceil(hours * min_coverage)))] = np.nan
+        averaged[pollutant] = mean
+    return averaged
+
+def compute_aqi(readings, standard='IN', averaged=True, time='time', station=None):
+    """AQI and dominant pollutant for every row of a readings DataFrame.
+
+    With averaged=True concentrations are first averaged over the standard's
+    windows, which needs a datetime column `time` (and a `station` column for
+    multi-station batches). With averaged=False each hour is scored on its own.
+    """
+    if averaged:
+        readings = rolling_concentrations(readings, standard, time=time, station=station)
+    indices = sub_indices(readings, standard)
+
+    aqi = _combine(indices.to_numpy(), STANDARDS[standard]['min_pollutants'])
+    dominant = indices.fillna(-1).idxmax(axis=1).where(aqi >= 0)
+
+    result = pd.DataFrame({'AQI': aqi, 'Dominant': dominant}, index=readings.index)
+    result['Dominant'] = result['Dominant'].astype(pd.CategoricalDtype(list(indices.columns)))
+    return result
+
+def daily_aqi(readings, standard='IN', time='time', station=None, min_coverage=0.75):
+    """Daily AQI per station and calendar day.
+
+    Pollutants with a 24-hour window use the day's mean concentration; shorter
+    windows use the day's highest rolling average, as the daily AQI rules of
+    both standards do. Days with too few hours present are NaN.
+    """
+    averaged = rolling_concentrations(readings, standard, time=time, station=station,
+                                      min_coverage=min_coverage)
+    keys = ([station] if station else []) + ['date']
+    averaged['date'] = averaged[time].dt.floor('D')
+
+    daily = {}
+    for pollutant, (_, hours, _) in STANDARDS[standard]['pollutants'].items():
+        if pollutant not in readings.columns:
+            continue
+        if hours == 24:
+            raw = averaged[keys].assign(value=readings.loc[averaged.index, pollutant].to_numpy())
+            grouped = raw.groupby(keys, observed=True)['value']
+            mean, count = grouped.mean(), grouped.count()
+            daily[pollutant] = mean.where(count >= int(np.ceil(24 * min_coverage)))
+        else:
+            daily[pollutant] = averaged.groupby(keys, observed=True)[pollutant].max()
+
+    daily = pd.DataFrame(daily)
+    result = compute_aqi(daily, standard, averaged=False)
+    result['AQI'] = result['AQI'].where(result['AQI'] >= 0)
+    return result.reset_index()
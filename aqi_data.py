@@ -0,0 +1,658 @@
+"""Data and metrics layer of the dashboard, usable without Streamlit or Plotly.
+
+Everything the dashboard shows is computed here: AQI classification and mask
+advice, the city registry and its search index, simulated readings and the
+shared daily snapshot, the station catalogue, the reading store sync and
+forecasts. aqi_dash wraps these functions in its caches and draws the
+results. The command line computes the
+headline metrics of every city in one batch, for reports or cron jobs:
+
+    python aqi_data.py metrics --output metrics.parquet
+    python aqi_data.py prewarm
+    python aqi_data.py memory
+
+prewarm brings the reading store and its rollups up to the current hour, so
+the first dashboard session after it does not pay for the sync. memory
+reports the bytes per row of the data layer's frames with their compact
+dtypes (int16 AQI, float32 concentrations, datetimes and categoricals)
+against the dtypes pandas infers without them.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aqi_compute import POLLUTANTS, READING_DTYPES, aqi_from_array
+from aqi_forecast import forecast, forecast_frame
+from aqi_geo import KM_PER_DEGREE, SpatialIndex
+
+# Upper bound (inclusive) of each AQI category, with its color and description
+AQI_CATEGORIES = pd.DataFrame({
+    'upper': [50, 100, 200, 300, np.inf],
+    'status': ['Good', 'Moderate', 'Unhealthy', 'Very Unhealthy', 'Hazardous'],
+    'color': ['#10b981', '#fbbf24', '#f97316', '#ef4444', '#991b1b'],
+    'description': ['Air quality is satisfactory', 'Acceptable for most people', 'Sensitive groups affected',
+                    'Health alert for everyone', 'Emergency conditions'],
+})
+
+def classify_aqi(aqi, categories=AQI_CATEGORIES):
+    """Classify an array or Series of AQI values in one pass.
+
+    Returns a DataFrame of categorical Status, Color and Description columns
+    aligned with the input. Missing values get missing categories.
+    """
+    values = np.asarray(aqi, dtype=float)
+    codes = np.searchsorted(categories['upper'].to_numpy(dtype=float), values, side='left')
+    codes[np.isnan(values)] = -1
+    index = aqi.index if isinstance(aqi, pd.Series) else None
+    
+    return pd.DataFrame({
+        'Status': pd.Categorical.from_codes(codes, categories=categories['status'], ordered=True),
+        'Color': pd.Categorical.from_codes(codes, categories=categories['color']),
+        'Description': pd.Categorical.from_codes(codes, categories=categories['description']),
+    }, index=index)
+
+def get_aqi_status(aqi):
+    """Return AQI status, color, and description"""
+    category = AQI_CATEGORIES.iloc[np.searchsorted(AQI_CATEGORIES['upper'].to_numpy(), aqi, side='left')]
+    return category['status'], category['color'], category['description']
+
+# Mask advice by worst nearby AQI, on the same upper bounds as AQI_CATEGORIES
+MASK_RECOMMENDATIONS = pd.DataFrame({
+    'upper': [50, 100, 200, 300, np.inf],
+    'mask': ['No Mask Required', 'Surgical Mask', 'N95 or Surgical Mask', 'N95/KN95 Mask', 'N99/P100 Respirator'],
+    'emoji': ['😊🟢', '😷🔵', '😷🟡', '😷🟠', '😷🔴'],
+    'description': ['Air quality is good', 'Basic protection for sensitive groups', 'Standard medical mask recommended',
+                    'Medical-grade mask with 95% filtration', 'Heavy-duty respirator with 99%+ filtration'],
+    'urgency': ['NOT NEEDED', 'OPTIONAL', 'RECOMMENDED', 'MANDATORY', 'CRITICAL'],
+    'color': ['#10b981', '#fbbf24', '#f97316', '#ef4444', '#991b1b'],
+})
+
+def mask_recommendation(aqi):
+    """Row of MASK_RECOMMENDATIONS for an AQI value"""
+    return MASK_RECOMMENDATIONS.iloc[np.searchsorted(MASK_RECOMMENDATIONS['upper'].to_numpy(), aqi, side='left')]
+
+# Health advice by worst nearby AQI; level names the alert box it is shown in, by increasing severity
+HEALTH_ADVISORIES = pd.DataFrame({
+    'upper': [100, 200, 300, np.inf],
+    'level': ['success', 'info', 'warning', 'error'],
+    'title': ['Air Quality Acceptable', 'Moderate Alert', 'High Alert!', 'Emergency Alert!'],
+    'advice': [
+        ['Normal outdoor activities OK', 'No special precautions needed'],
+        ['Sensitive groups use masks', 'Reduce prolonged outdoor activities', 'Monitor symptoms'],
+        ['Limit outdoor exposure', 'Wear N95 masks outdoors', 'Children/elderly stay indoors', 'Avoid heavy exercise'],
+        ['Avoid all outdoor activities', 'Keep windows/doors closed', 'Use air purifiers indoors',
+         'Seek medical help if breathing issues occur'],
+    ],
+})
+
+def health_advisory(aqi):
+    """Row of HEALTH_ADVISORIES for an AQI value"""
+    return HEALTH_ADVISORIES.iloc[np.searchsorted(HEALTH_ADVISORIES['upper'].to_numpy(), aqi, side='left')]
+
+CITY_REGISTRY_PATH = Path(os.environ.get('AQI_CITY_REGISTRY', Path(__file__).with_name('cities.csv')))
+
+def load_city_registry(path=CITY_REGISTRY_PATH):
+    """Load the city catalogue from CSV or Parquet into a compact columnar frame.
+
+    The frame is indexed by city name, so lookups such as
+    cities.at[city, 'base_aqi'] are hash-indexed reads.
+    """
+    path = Path(path)
+    if path.suffix == '.parquet':
+        cities = pd.read_parquet(path, columns=['name', 'country', 'flag', 'base_aqi', 'lat', 'lon'])
+    else:
+        cities = pd.read_csv(path, encoding='utf-8')
+    
+    cities = cities.astype({
+        'name': str,
+        'country': 'category',
+        'flag': 'category',
+        'base_aqi': 'int16',
+        'lat': 'float32',
+        'lon': 'float32',
+    }).set_index('name')
+    if not cities.index.is_unique:
+        raise ValueError(f"Duplicate city names in {path}")
+    
+    cities['status'] = classify_aqi(cities['base_aqi'])['Status']
+    return cities
+
+SEARCH_RESULT_LIMIT = 8
+
+def normalize_text(text):
+    """Case-fold text and strip accents, so 'sao paulo' matches 'São Paulo'"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+class CitySearchIndex:
+    """Prebuilt search index over city and country names.
+
+    Name and word prefixes are binary searches over sorted arrays; substring
+    matches of three or more characters intersect trigram posting lists and
+    only verify the surviving candidates. Results are ranked name prefix
+    (exact match first), word prefix, name substring, then country match.
+    """
+
+    def __init__(self, names, countries):
+        self.names = np.array([normalize_text(name) for name in names], dtype=object)
+        
+        country_codes, country_names = pd.factorize(pd.Series(countries, dtype=str))
+        self.countries = [normalize_text(country) for country in country_names]
+        order = np.argsort(country_codes, kind='stable')
+        splits = np.flatnonzero(np.diff(country_codes[order])) + 1
+        self.country_rows = np.split(order.astype(np.int32), splits) if len(order) else []
+        
+        self.name_order = np.argsort(self.names, kind='stable').astype(np.int32)
+        self.sorted_names = self.names[self.name_order]
+        
+        words, word_rows = [], []
+        postings = {}
+        for row, name in enumerate(self.names):
+            for word in name.split()[1:]:
+                words.append(word)
+                word_rows.append(row)
+            for gram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                postings.setdefault(gram, []).append(row)
+        word_order = np.argsort(np.array(words, dtype=object), kind='stable')
+        self.sorted_words = np.array(words, dtype=object)[word_order]
+        self.word_rows = np.array(word_rows, dtype=np.int32)[word_order]
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def _prefix_rows(self, sorted_keys, rows, prefix):
+        lo = np.searchsorted(sorted_keys, prefix, side='left')
+        hi = np.searchsorted(sorted_keys, prefix + '\uffff', side='left')
+        return rows[lo:hi]
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Return up to limit row positions matching query, best first"""
+        query = normalize_text(query).strip()
+        if not query:
+            return []
+        
+        ranked = list(self._prefix_rows(self.sorted_names, self.name_order, query)[:limit])
+        ranked.extend(self._prefix_rows(self.sorted_words, self.word_rows, query)[:limit])
+        
+        if len(ranked) < limit and len(query) >= 3:
+            grams = {query[i:i + 3] for i in range(len(query) - 2)}
+            candidates = None
+            for posting in sorted((self.postings.get(gram, ()) for gram in grams), key=len):
+                candidates = posting if candidates is None else np.intersect1d(candidates, posting, assume_unique=True)
+                if len(candidates) == 0:
+                    break
+            
+            for row in candidates:
+                if len(ranked) >= limit * 2:
+                    break
+                if query in self.names[row]:
+                    ranked.append(row)
+        
+        for country, rows in zip(self.countries, self.country_rows):
+            if len(ranked) >= limit * 2:
+                break
+            if country.startswith(query) or (len(query) >= 3 and query in country):
+                ranked.extend(rows[:limit])
+        
+        return list(dict.fromkeys(int(row) for row in ranked))[:limit]
+
+# Concentration per point of the city's AQI level, in µg/m³ (CO in mg/m³)
+POLLUTANT_RATIOS = np.array([0.65, 0.85, 0.28, 0.15, 0.012, 0.22])
+AQI_STANDARD = 'IN'
+
+# Traffic multiplier for each hour of the day
+HOURLY_MULTIPLIERS = np.ones(24)
+HOURLY_MULTIPLIERS[7:11] = 1.3      # morning rush
+HOURLY_MULTIPLIERS[18:22] = 1.15    # evening rush
+HOURLY_MULTIPLIERS[23:] = 0.7       # night
+HOURLY_MULTIPLIERS[:6] = 0.7
+HOURLY_MULTIPLIERS[13:17] = 0.85    # afternoon dip
+
+def simulate_readings(base_aqi, n_hours=24, start_hour=0, rng=None):
+    """Generate pollutant readings for many cities in one pass.
+
+    Returns a float32 array of shape (cities, hours, 1 + len(POLLUTANTS))
+    holding the hourly AQI followed by each pollutant's concentration, for hours
+    start_hour .. start_hour + n_hours. The AQI is computed from the
+    concentrations with the AQI_STANDARD breakpoint tables.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    base_aqi = np.asarray(base_aqi, dtype=float)
+    hour_of_day = (start_hour + np.arange(n_hours)) % 24
+
+    variation = rng.uniform(0.92, 1.08, size=(base_aqi.size, n_hours))
+    level = base_aqi[:, None] * HOURLY_MULTIPLIERS[hour_of_day] * variation
+
+    noise = rng.uniform(0.95, 1.05, size=(base_aqi.size, n_hours, len(POLLUTANTS)))
+    pollutants = np.round(level[:, :, None] * POLLUTANT_RATIOS * noise, 1)
+    aqi = aqi_from_array(pollutants, POLLUTANTS, AQI_STANDARD)
+
+    return np.concatenate([aqi[:, :, None], pollutants], axis=2, dtype=np.float32)
+
+def readings_frame(readings, start):
+    """Per-hour DataFrame of one city's slice of simulate_readings, whose first hour is start"""
+    df = pd.DataFrame(readings, columns=['AQI'] + POLLUTANTS).astype(READING_DTYPES)
+    df.insert(0, 'Hour', pd.date_range(start, periods=len(readings), freq='h'))
+    return df
+
+def readings_long_frame(readings, cities, start):
+    """One row per city and hour for a simulate_readings block starting at start"""
+    n_cities, n_hours, _ = readings.shape
+    df = pd.DataFrame(readings.reshape(n_cities * n_hours, -1), columns=['AQI'] + POLLUTANTS).astype(READING_DTYPES)
+    df.insert(0, 'time', np.tile(pd.date_range(start, periods=n_hours, freq='h'), n_cities))
+    df.insert(0, 'city', pd.Categorical(np.repeat(np.asarray(cities), n_hours)))
+    return df
+
+CACHE_TTL_SECONDS = 15 * 60
+CACHE_MAX_ENTRIES = 512
+DATA_SOURCE = os.environ.get('AQI_DATA_SOURCE', 'synthetic')
+
+class DataCache:
+    """Thread-safe TTL cache with LRU eviction, shared by every session"""
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """The cached value for key, or default on a miss (which is not counted)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() on a miss.
+
+        Concurrent misses on one key compute it once; the other callers wait
+        for that result instead of computing their own copy.
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another caller is computing this key; if it fails, the next loop computes it here
+            pending.wait()
+        
+        try:
+            value = compute()
+            with self._lock:
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+def time_bucket(now=None):
+    """Cache bucket for generated data: one per calendar day"""
+    return (now or datetime.now()).strftime('%Y-%m-%d')
+
+def hour_bucket(now=None):
+    """Cache bucket for data that grows every hour, such as the stored history"""
+    return (now or datetime.now()).strftime('%Y-%m-%d %H')
+
+def seeded_rng(*key):
+    """Random generator seeded from a cache key, stable across processes"""
+    return np.random.default_rng(zlib.crc32('|'.join(map(str, key)).encode()))
+
+def city_readings(cities, bucket, source=DATA_SOURCE):
+    """24-hour readings block for every city on the day `bucket`, uncached"""
+    return simulate_readings(cities['base_aqi'].to_numpy(), rng=seeded_rng('readings', source, bucket))
+
+class Snapshot:
+    """The data of one refresh that every session shows, built once per process.
+
+    A snapshot is never modified after it is built: its readings array is
+    marked read-only. Sessions take
+    a reference at the start of a run and derive their own small views
+    from it, so the per-session cost is that view plus the session's UI
+    state, whatever the number of viewers. `python aqi_bench.py --only
+    sessions` measures what each extra session holds (about 150-250 kB,
+    mostly its rendered elements).
+    """
+    __slots__ = ('key', 'readings', 'built')
+
+    def __init__(self, key, readings):
+        readings.flags.writeable = False
+        self.key = key
+        self.readings = readings
+        self.built = time.time()
+
+    def nbytes(self):
+        """Memory held by the snapshot's data"""
+        return self.readings.nbytes
+
+def build_snapshot(cities, bucket, source=DATA_SOURCE):
+    """Snapshot of the day `bucket`: every city's 24-hour readings"""
+    return Snapshot((source, bucket), city_readings(cities, bucket, source))
+
+class SnapshotHolder:
+    """The current Snapshot of a process, replaced atomically when its key changes.
+
+    The first caller that asks for a new key builds the replacement while
+    every other caller keeps getting the previous snapshot, so a refresh is
+    computed once per process rather than once per session, and readers
+    never wait for one unless no snapshot exists yet.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self._current = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        current = self._current
+        if current is not None and current.key == key:
+            return current
+        if not self._lock.acquire(blocking=current is None):
+            return current
+        try:
+            if self._current is None or self._current.key != key:
+                self._current = self.build(key)
+            return self._current
+        finally:
+            self._lock.release()
+
+STATIONS_PATH = Path(os.environ.get('AQI_STATIONS', Path(__file__).with_name('stations.csv')))
+HOTSPOT_RADIUS_KM = 25
+STATION_ZONES = ['Traffic Hub', 'Industrial', 'Residential', 'Commercial', 'Green Zone']
+COMPASS_POINTS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+
+def load_stations(path=STATIONS_PATH):
+    """Load the monitoring station / hotspot catalogue from CSV or Parquet"""
+    path = Path(path)
+    stations = pd.read_parquet(path) if path.suffix == '.parquet' else pd.read_csv(path, encoding='utf-8')
+    return stations.astype({'city': 'category', 'zone': 'category', 'aqi': 'int16'})
+
+def synthetic_stations(cities, per_city=6, radius_km=15, rng=None):
+    """Simulated stations spread around each city, for cities without real ones"""
+    rng = rng if rng is not None else np.random.default_rng()
+    n = len(cities) * per_city
+    bearing = np.tile(np.arange(per_city) * 360 / per_city, len(cities)) + rng.uniform(-5, 5, n)
+    distance = radius_km * np.sqrt(rng.uniform(0.05, 1, n))
+    lat = np.repeat(cities['lat'].to_numpy(dtype=float), per_city)
+    lon = np.repeat(cities['lon'].to_numpy(dtype=float), per_city)
+    
+    lat_offset = distance * np.cos(np.radians(bearing)) / KM_PER_DEGREE
+    lon_offset = distance * np.sin(np.radians(bearing)) / (KM_PER_DEGREE * np.cos(np.radians(lat)))
+    names = np.repeat(cities.index.to_numpy(dtype=str), per_city)
+    directions = np.array(COMPASS_POINTS)[np.rint(bearing / 45).astype(int) % 8]
+    
+    return pd.DataFrame({
+        'name': np.char.add(np.char.add(names, ' '), directions),
+        'city': pd.Categorical(names),
+        'lat': lat + lat_offset,
+        'lon': lon + lon_offset,
+        'aqi': (np.repeat(cities['base_aqi'].to_numpy(), per_city) * rng.uniform(0.8, 1.35, n)).astype('int16'),
+        'zone': pd.Categorical(rng.choice(STATION_ZONES, n)),
+    })
+
+def station_catalogue(cities, source=DATA_SOURCE, path=STATIONS_PATH):
+    """Station catalogue and its spatial index; cities with no stations nearby get simulated ones"""
+    stations = load_stations(path)
+    index = SpatialIndex(stations['lat'], stations['lon'])
+    covered = np.array([len(index.within(lat, lon, HOTSPOT_RADIUS_KM)[0]) > 0
+                        for lat, lon in zip(cities['lat'], cities['lon'])], dtype=bool)
+    
+    simulated = synthetic_stations(cities[~covered], rng=seeded_rng('stations', source))
+    stations = pd.concat([stations, simulated], ignore_index=True)
+    stations = stations.astype({'city': 'category', 'zone': 'category', 'lat': 'float32', 'lon': 'float32'})
+    return stations, SpatialIndex(stations['lat'], stations['lon'])
+
+def station_hourly_aqi(stations, cities, city_aqi):
+    """Every station's AQI in an hour where the cities read city_aqi.
+
+    A station keeps its catalogue ratio to its city's base AQI, so it moves
+    with its city from hour to hour; stations of cities outside the registry
+    keep their catalogue AQI.
+    """
+    scale = pd.Series(np.asarray(city_aqi, dtype=float) / cities['base_aqi'].to_numpy(dtype=float), index=cities.index)
+    scale = scale.reindex(stations['city'].astype(str)).fillna(1.0).to_numpy()
+    return np.rint(stations['aqi'].to_numpy(dtype=float) * scale)
+
+HISTORY_DAYS = 90
+DATA_DIR = Path(os.environ.get('AQI_DATA_DIR', Path(__file__).with_name('data')))
+
+def sync_reading_store(store, cities, now=None, source=DATA_SOURCE):
+    """Append every hour up to now that the store does not hold yet.
+
+    An empty store is backfilled with HISTORY_DAYS of history. Days that are
+    complete get their hourly part files compacted, and so do whole months.
+    """
+    now = pd.Timestamp(now or datetime.now()).floor('h')
+    with store.lock:
+        last = store.last_time()
+        start = last + pd.Timedelta(hours=1) if last is not None else now.normalize() - pd.Timedelta(days=HISTORY_DAYS)
+        
+        for day in pd.date_range(start.normalize(), now.normalize(), freq='D'):
+            frame = readings_long_frame(city_readings(cities, time_bucket(day), source), cities.index, day)
+            frame = frame[(frame['time'] >= start) & (frame['time'] <= now)]
+            if not frame.empty:
+                store.append(frame)
+            if day < now.normalize():
+                store.compact(day)
+            if day.is_month_end and day.month != now.month:
+                store.compact_month(day)
+
+def refresh_history(store, rollups, cities, source=DATA_SOURCE):
+    """Bring the reading store and its rollups up to the current hour"""
+    if source == 'synthetic':
+        # Live sources are written to the store by the aqi_ingest service instead
+        sync_reading_store(store, cities, source=source)
+    rollups.catch_up()
+
+FORECAST_HORIZON = 72
+FORECAST_HISTORY_DAYS = 14
+
+def generate_forecasts(store, cities, now=None):
+    """AQI forecast for every city, FORECAST_HORIZON hours past the latest stored hour"""
+    end = pd.Timestamp(now or datetime.now()).floor('h')
+    hours = pd.date_range(end - pd.Timedelta(days=FORECAST_HISTORY_DAYS) + pd.Timedelta(hours=1), end, freq='h')
+    history = store.read(cities, hours[0], end, columns=['AQI'])
+    # -1 marks a reading with too few pollutants for an AQI; leave it out of the hourly mean
+    history['AQI'] = history['AQI'].where(history['AQI'] >= 0)
+    matrix = (history.pivot_table(index='city', columns='time', values='AQI', aggfunc='mean', observed=True)
+              .reindex(index=list(cities), columns=hours))
+    return forecast_frame(cities, end + pd.Timedelta(hours=1), forecast(matrix.to_numpy(dtype=float), FORECAST_HORIZON))
+
+METRICS_POOL_MIN_CITIES = 2000
+
+def worst_hotspot_aqi(cities, stations, station_index, radius_km=HOTSPOT_RADIUS_KM):
+    """Highest station AQI within radius_km of each city; NaN where there is none"""
+    station_aqi = stations['aqi'].to_numpy(dtype=float)
+    worst = np.full(len(cities), np.nan)
+    for i, (lat, lon) in enumerate(zip(cities['lat'], cities['lon'])):
+        rows, _ = station_index.within(lat, lon, radius_km)
+        if len(rows):
+            worst[i] = station_aqi[rows].max()
+    return worst
+
+def city_metrics(cities, readings, current_hour, stations, station_index):
+    """The dashboard's headline numbers for every city of a 24-hour readings block.
+
+    Current AQI and status, 24-hour average, peak hour and the mask advice
+    for the worst station nearby, one row per city.
+    """
+    aqi = readings[:, :, 0]
+    current = aqi[:, current_hour]
+    worst = worst_hotspot_aqi(cities, stations, station_index)
+    masks = MASK_RECOMMENDATIONS.iloc[np.searchsorted(MASK_RECOMMENDATIONS['upper'].to_numpy(),
+                                                      np.nan_to_num(worst), side='left')]
+    return pd.DataFrame({
+        'country': cities['country'],
+        'current_aqi': current.astype(np.int16),
+        'status': classify_aqi(current)['Status'].array,
+        'avg_24h': aqi.mean(axis=1, dtype=float).round(1),
+        'peak_hour': pd.Categorical(np.char.mod('%02d:00', aqi.argmax(axis=1))),
+        'peak_aqi': aqi.max(axis=1).astype(np.int16),
+        'worst_hotspot_aqi': worst.astype(np.float32),
+        'mask': pd.Categorical(masks['mask']),
+        'mask_urgency': pd.Categorical(masks['urgency']),
+    }, index=cities.index)
+
+def compute_metrics(cities, bucket, current_hour, source=DATA_SOURCE, workers=None):
+    """city_metrics for the whole registry on day `bucket`, plus each city's rank by current AQI.
+
+    With more than one worker the cities are split across a process pool; by
+    default registries of METRICS_POOL_MIN_CITIES or more use one process per
+    CPU.
+    """
+    readings = city_readings(cities, bucket, source)
+    stations, station_index = station_catalogue(cities, source)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(cities) >= METRICS_POOL_MIN_CITIES else 1
+    
+    if workers <= 1:
+        metrics = city_metrics(cities, readings, current_hour, stations, station_index)
+    else:
+        chunks = np.array_split(np.arange(len(cities)), workers)
+        with ProcessPoolExecutor(workers) as pool:
+            metrics = pd.concat(pool.map(city_metrics, [cities.iloc[rows] for rows in chunks],
+                                         [readings[rows] for rows in chunks], [current_hour] * workers,
+                                         [stations] * workers, [station_index] * workers))
+    # The order of the dashboard's ranking of cities at this hour: 1 is the most polluted, ties in registry order
+    metrics['comparison_rank'] = metrics['current_aqi'].rank(ascending=False, method='first').astype(int)
+    return metrics
+
+def _inferred_dtypes(frame):
+    """frame with the dtypes pandas infers from Python lists: int64, float64 and strings"""
+    dtypes = {}
+    for column, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[column] = str
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = 'int64'
+        elif pd.api.types.is_float_dtype(dtype):
+            dtypes[column] = 'float64'
+    return frame.astype(dtypes)
+
+def memory_report(n_cities=1000, n_hours=24 * 30):
+    """Bytes per row of the data layer's frames, with their compact dtypes and with inferred ones.
+
+    The inferred layout is what building the same frames from Python lists
+    gives: int64 and float64 numbers, strings for categories and, in the
+    24-hour frame, formatted 'HH:00' hours.
+    """
+    rng = np.random.default_rng(0)
+    cities = pd.DataFrame({
+        'country': pd.Categorical(rng.choice(['India', 'China', 'United States', 'Brazil', 'France'], n_cities)),
+        'flag': pd.Categorical(['🏳️'] * n_cities),
+        'base_aqi': rng.integers(20, 400, n_cities).astype(np.int16),
+        'lat': rng.uniform(-60, 70, n_cities).astype(np.float32),
+        'lon': rng.uniform(-180, 180, n_cities).astype(np.float32),
+    }, index=pd.Index([f'City {i}' for i in range(n_cities)], name='name'))
+    readings = simulate_readings(cities['base_aqi'].to_numpy(), n_hours=n_hours, rng=rng)
+    stations = synthetic_stations(cities, rng=rng).astype({'lat': 'float32', 'lon': 'float32'})
+    frames = {
+        'readings (per station-hour)': readings_long_frame(readings, cities.index, '2024-01-01'),
+        '24-hour frame (per hour)': readings_frame(readings[0, :24], '2024-01-01'),
+        'stations (per station)': stations,
+        'city metrics (per city)': city_metrics(cities, readings[:, :24], 12, stations,
+                                                SpatialIndex(stations['lat'], stations['lon'])),
+    }
+    rows = []
+    for name, frame in frames.items():
+        inferred = _inferred_dtypes(frame)
+        if 'Hour' in inferred:
+            inferred['Hour'] = inferred['Hour'].dt.strftime('%H:00')
+        rows.append((name, len(frame), inferred.memory_usage(deep=True).sum() / len(frame),
+                     frame.memory_usage(deep=True).sum() / len(frame)))
+    rows.append(('snapshot array (per city-hour)', readings.shape[0] * readings.shape[1],
+                 readings.astype(float).nbytes / readings[..., 0].size, readings.nbytes / readings[..., 0].size))
+    report = pd.DataFrame(rows, columns=['frame', 'rows', 'inferred bytes/row', 'compact bytes/row'])
+    report['saving'] = report['inferred bytes/row'] / report['compact bytes/row']
+    return report.set_index('frame')
+
+def _memory(args):
+    report = memory_report(args.report_cities, args.hours)
+    print(report.round({'inferred bytes/row': 1, 'compact bytes/row': 1, 'saving': 2}).to_string())
+
+def _metrics(args):
+    cities = load_city_registry(args.cities)
+    now = datetime.now()
+    bucket = args.date or time_bucket(now)
+    hour = now.hour if args.hour is None else args.hour
+    
+    started = time.perf_counter()
+    metrics = compute_metrics(cities, bucket, hour, args.source, args.workers)
+    metrics.insert(0, 'date', bucket)
+    metrics.insert(1, 'hour', hour)
+    metrics = metrics.rename_axis('city').reset_index()
+    
+    if args.output and Path(args.output).suffix == '.parquet':
+        metrics.to_parquet(args.output, index=False)
+    else:
+        text = metrics.to_json(orient='records', force_ascii=False, indent=1)
+        if args.output:
+            Path(args.output).write_text(text, encoding='utf-8')
+        else:
+            print(text)
+    print(f"{len(metrics)} cities in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+def _prewarm(args):
+    from aqi_rollup import RollupStore
+    from aqi_store import ReadingStore
+    started = time.perf_counter()
+    store = ReadingStore(Path(args.data_dir) / 'readings')
+    refresh_history(store, RollupStore(store), load_city_registry(args.cities), args.source)
+    print(f"Store and rollups current to {store.last_time()} in {time.perf_counter() - started:.2f}s",
+          file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', default=CITY_REGISTRY_PATH, help='city registry, CSV or Parquet')
+    parser.add_argument('--source', default=DATA_SOURCE, help='data source name (default $AQI_DATA_SOURCE)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    metrics = commands.add_parser('metrics', help="compute every city's headline metrics")
+    metrics.add_argument('--output', '-o', help='.json or .parquet file; JSON on stdout by default')
+    metrics.add_argument('--date', help='day to report, YYYY-MM-DD (default today)')
+    metrics.add_argument('--hour', type=int, help='hour of the current reading (default now)')
+    metrics.add_argument('--workers', type=int, help='processes (default: one per CPU for large registries)')
+
+    prewarm = commands.add_parser('prewarm', help='sync the reading store and rollups to the current hour')
+    prewarm.add_argument('--data-dir', default=DATA_DIR)
+
+    memory = commands.add_parser('memory', help='report bytes per row of the in-memory frames')
+    memory.add_argument('--report-cities', type=int, default=1000, help='simulated cities')
+    memory.add_argument('--hours', type=int, default=24 * 30, help='simulated hours per city')
+
+    args = parser.parse_args(argv)
+    {'metrics': _metrics, 'prewarm': _prewarm, 'memory': _memory}[args.command](args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Downsampling of time series before they are sent to a chart.
+
+minmax() keeps the lowest and highest point of every bucket, so no peak or
+trough disappears, and is fully vectorised. lttb() (Largest-Triangle-Three-
+Buckets) keeps, per bucket, the point forming the largest triangle with its
+neighbours, which best preserves the visual shape of the line. downsample()
+chains them: a min/max pass first cuts very long series to a few candidates
+per output point, LTTB picks the final points, and the series' overall
+minimum and maximum are always kept.
+
+Every function returns sorted row positions, so all columns belonging to a
+trace (hover data, colours) can be sliced with the same indices.
+"""
+import numpy as np
+import pandas as pd
+
+PRESELECT_FACTOR = 4    # min/max candidates per output point before LTTB
+
+def _numeric_x(x):
+    """x as floats: datetimes as nanoseconds, labels by position"""
+    x = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return x.to_numpy().astype('datetime64[ns]').astype(np.int64).astype(float)
+    if pd.api.types.is_numeric_dtype(x):
+        return x.to_numpy(dtype=float)
+    return np.arange(len(x), dtype=float)
+
+def minmax(y, n_out):
+    """Positions of the minimum and maximum of n_out // 2 equal-count buckets"""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n <= n_out:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+
+    lows = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    chosen = np.union1d(lows, highs)
+    return chosen[chosen < n]
+
+def lttb(x, y, n_out):
+    """Positions chosen by Largest-Triangle-Three-Buckets; always keeps the end points"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n) if n <= n_out else np.array([0, n - 1])
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    chosen = np.empty(n_out, dtype=np.int64)
+    chosen[0], chosen[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        following = slice(stop, edges[i + 2] if i + 2 < len(edges) else n)
+        next_x, next_y = x[following].mean(), y[following].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        chosen[i + 1] = previous
+    return chosen
+
+def downsample(x, y, max_points):
+    """Sorted positions of at most max_points points that keep the shape and the extremes of y"""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    x = _numeric_x(x)
+
+    candidates = np.arange(n)
+    if n > PRESELECT_FACTOR * max_points:
+        candidates = minmax(y, PRESELECT_FACTOR * max_points)
+    chosen = candidates[lttb(x[candidates], y[candidates], max(3, max_points - 2))]
+    if np.isnan(y).all():
+        return chosen
+    return np.union1d(chosen, [np.nanargmin(y), np.nanargmax(y)])
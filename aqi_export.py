@@ -0,0 +1,303 @@
+"""Streaming bulk export of readings and history to CSV, Parquet and Arrow.
+
+An export is a stream of Arrow record batches, read from the reading store a
+file at a time (or from the rollups a chunk of cities at a time) and encoded
+as it goes, so memory stays around one batch however many cities and days
+it covers. The datasets are:
+
+- ``aqi``: hourly AQI, the series behind the 24-hour trend;
+- ``pollutants``: hourly pollutant concentrations;
+- ``readings``: hourly AQI and pollutants;
+- ``history``: day, week or month rollup statistics.
+
+The export server streams them over HTTP with chunked transfer encoding, on
+a thread per download, so a long export never holds up a dashboard session.
+The dashboard starts one in the background and its download buttons link
+to it; it can also run on its own:
+
+    python aqi_export.py serve --port 8502
+    curl -O 'http://localhost:8502/export/readings.parquet?city=Delhi&city=London&start=2025-01-01&end=2025-12-31'
+    python aqi_export.py history --city Delhi --start 2024-01-01 --level week -o delhi.csv
+
+start and end are days (end inclusive) or times; by default an export
+covers the last 24 hours, and the server refuses ranges longer than
+AQI_EXPORT_MAX_DAYS (default 366).
+
+The server has no authentication, so it binds to 127.0.0.1 unless
+AQI_EXPORT_HOST (or serve --host) says otherwise. When the dashboard is
+deployed remotely, the browser cannot reach that address: put the export
+server behind the same proxy as the dashboard (or bind it to a public
+address the proxy or network restricts) and set AQI_EXPORT_URL to the base
+URL the browser reaches it on, e.g. https://aqi.example.org/exports, so the
+download buttons link there instead of http://localhost:8502.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from aqi_compute import POLLUTANTS
+from aqi_data import CITY_REGISTRY_PATH, DATA_DIR, load_city_registry
+
+# Columns of each hourly dataset; history comes from the rollups instead
+DATASETS = {'aqi': ['AQI'], 'pollutants': POLLUTANTS, 'readings': ['AQI'] + POLLUTANTS, 'history': None}
+FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+HISTORY_LEVELS = ['day', 'week', 'month']
+EXPORT_BATCH_ROWS = 65536
+HISTORY_CITY_CHUNK = 256
+EXPORT_PORT = int(os.environ.get('AQI_EXPORT_PORT', 8502))
+# Loopback only by default; '' or 0.0.0.0 serves every interface, with no authentication
+EXPORT_HOST = os.environ.get('AQI_EXPORT_HOST', '127.0.0.1')
+# Longest range the server exports in one request
+EXPORT_MAX_DAYS = int(os.environ.get('AQI_EXPORT_MAX_DAYS', 366))
+# Base URL the browser reaches the export server on, when it is not localhost
+EXPORT_URL = os.environ.get('AQI_EXPORT_URL', f'http://localhost:{EXPORT_PORT}')
+
+def export_range(start=None, end=None, now=None, max_days=None):
+    """(start, end) times of an export; a day given as end includes all its hours.
+
+    With max_days, a range longer than that many days is refused.
+    """
+    end_time = pd.Timestamp(end) if end else pd.Timestamp(now or datetime.now()).floor('h')
+    if end and len(str(end)) <= len('YYYY-MM-DD'):
+        end_time += pd.Timedelta(hours=23)
+    start_time = pd.Timestamp(start) if start else end_time - pd.Timedelta(hours=23)
+    if start_time > end_time:
+        raise ValueError(f"start {start_time} is after end {end_time}")
+    if max_days is not None and end_time - start_time >= pd.Timedelta(days=max_days):
+        raise ValueError(f"Exports cover at most {max_days} days; split the range from {start_time} to {end_time}")
+    return start_time, end_time
+
+def export_batches(store, rollups, dataset, cities, start, end, level='day'):
+    """Record batches of one dataset for the given cities (None for all) and time range"""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset!r}; expected one of {list(DATASETS)}")
+    if dataset != 'history':
+        return store.scan(cities, start, end, columns=DATASETS[dataset])
+    if level not in HISTORY_LEVELS:
+        raise ValueError(f"Unknown history level {level!r}; expected one of {HISTORY_LEVELS}")
+    return _history_batches(rollups, list(cities), start, end, level)
+
+def _history_batches(rollups, cities, start, end, level):
+    for i in range(0, len(cities), HISTORY_CITY_CHUNK):
+        frame = rollups.read(cities[i:i + HISTORY_CITY_CHUNK], start, end, level)
+        if len(frame):
+            yield pa.RecordBatch.from_pandas(frame, preserve_index=False)
+
+class _ChunkSink:
+    """Write-only file object whose bytes are taken out as chunks; tell() counts every byte ever written"""
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._written = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _writer(fmt, sink, schema):
+    if fmt == 'csv':
+        return pcsv.CSVWriter(sink, schema)
+    if fmt == 'parquet':
+        return pq.ParquetWriter(sink, schema)
+    if fmt == 'arrow':
+        return ipc.new_stream(sink, schema)
+    raise ValueError(f"Unknown format {fmt!r}; expected one of {list(FORMATS)}")
+
+def encode(batches, fmt, batch_rows=EXPORT_BATCH_ROWS):
+    """Encode record batches as a stream of byte chunks in one of FORMATS.
+
+    Small batches (a selective filter yields many) are coalesced up to
+    batch_rows rows, which becomes one Parquet row group. An empty export
+    produces no bytes.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {list(FORMATS)}")
+    sink, writer, pending, rows = _ChunkSink(), None, [], 0
+    for batch in batches:
+        if writer is None:
+            schema = batch.schema.remove_metadata()
+            writer = _writer(fmt, sink, schema)
+        if batch.num_rows == 0:
+            continue
+        pending.append(batch if batch.schema.equals(schema) else batch.cast(schema))
+        rows += batch.num_rows
+        if rows >= batch_rows:
+            writer.write_table(pa.Table.from_batches(pending, schema))
+            pending, rows = [], 0
+            yield sink.take()
+    if writer is None:
+        return
+    if pending:
+        writer.write_table(pa.Table.from_batches(pending, schema))
+    writer.close()
+    yield sink.take()
+
+def export_filename(dataset, fmt, start, end):
+    return f"aqi_{dataset}_{start:%Y%m%d}-{end:%Y%m%d}.{fmt}"
+
+def export_url(dataset, fmt, cities, start, end, level=None, base_url=EXPORT_URL):
+    """Link to an export on the export server"""
+    query = [('city', city) for city in cities] + [('start', str(start)), ('end', str(end))]
+    if level is not None:
+        query.append(('level', level))
+    return f"{base_url}/export/{quote(dataset)}.{quote(fmt)}?{urlencode(query)}"
+
+def export_server(store, rollups, cities, port=EXPORT_PORT, host=EXPORT_HOST, max_days=EXPORT_MAX_DAYS):
+    """Export server in a background thread, one thread per download; returns the server.
+
+    cities is the registry's index: requests naming other cities are refused,
+    and requests naming none export them all. Requests spanning more than
+    max_days days are refused.
+    """
+    known = pd.Index(cities)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            name = url.path[len('/export/'):] if url.path.startswith('/export/') else ''
+            dataset, _, fmt = name.partition('.')
+            query = parse_qs(url.query)
+            try:
+                requested = query.get('city')
+                unknown = pd.Index(requested or []).difference(known)
+                if dataset not in DATASETS or fmt not in FORMATS:
+                    raise ValueError(f"Expected /export/<{'|'.join(DATASETS)}>.<{'|'.join(FORMATS)}>")
+                if len(unknown):
+                    raise ValueError(f"Unknown cities: {', '.join(unknown[:10])}")
+                start, end = export_range(query.get('start', [None])[0], query.get('end', [None])[0],
+                                          max_days=max_days)
+                level = query.get('level', ['day'])[0]
+                batches = export_batches(store, rollups, dataset, requested or (known if dataset == 'history' else None),
+                                         start, end, level)
+            except ValueError as error:
+                return self._error(400, str(error))
+
+            self.send_response(200)
+            self.send_header('Content-Type', FORMATS[fmt])
+            self.send_header('Content-Disposition',
+                             f'attachment; filename="{export_filename(dataset, fmt, start, end)}"')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            chunks = encode(batches, fmt)
+            try:
+                for chunk in chunks:
+                    if chunk:
+                        self.wfile.write(b'%x\r\n%b\r\n' % (len(chunk), chunk))
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass    # the download was cancelled
+            except Exception:
+                # Headers are out; dropping the connection without the final chunk marks the file as truncated
+                self.close_connection = True
+                raise
+            finally:
+                chunks.close()
+
+        def _error(self, status, message):
+            body = message.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _stores(data_dir):
+    from aqi_rollup import RollupStore
+    from aqi_store import ReadingStore
+    store = ReadingStore(Path(data_dir) / 'readings')
+    return store, RollupStore(store)
+
+def _export(args):
+    store, rollups = _stores(args.data_dir)
+    start, end = export_range(args.start, args.end)
+    fmt = args.format or Path(args.output).suffix.lstrip('.')
+    cities = args.city or (load_city_registry(args.cities).index if args.command == 'history' else None)
+    started = time.perf_counter()
+    written = 0
+    with open(args.output, 'wb') as output:
+        for chunk in encode(export_batches(store, rollups, args.command, cities, start, end, args.level), fmt):
+            output.write(chunk)
+            written += len(chunk)
+    print(f"{written / 1e6:.1f} MB of {args.command} from {start} to {end} in {time.perf_counter() - started:.2f}s",
+          file=sys.stderr)
+
+def _serve(args):
+    store, rollups = _stores(args.data_dir)
+    server = export_server(store, rollups, load_city_registry(args.cities).index, args.port, args.host,
+                           args.max_days)
+    host, port = server.server_address[:2]
+    print(f"Export server on http://{host or '0.0.0.0'}:{port}/export/<dataset>.<format>", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', default=CITY_REGISTRY_PATH, help='city registry, CSV or Parquet')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for dataset in DATASETS:
+        export = commands.add_parser(dataset, help=f'export the {dataset} dataset to a file')
+        export.add_argument('--city', action='append', help='city to export, repeatable (default all)')
+        export.add_argument('--start', help='first day or time (default 24 hours before end)')
+        export.add_argument('--end', help='last day or time, inclusive (default now)')
+        export.add_argument('--level', default='day', choices=HISTORY_LEVELS, help='rollup level of history')
+        export.add_argument('--format', choices=list(FORMATS), help='default: from the output suffix')
+        export.add_argument('--output', '-o', required=True)
+
+    serve = commands.add_parser('serve', help='serve exports over HTTP')
+    serve.add_argument('--port', type=int, default=EXPORT_PORT)
+    serve.add_argument('--host', default=EXPORT_HOST,
+                       help='address to bind; 0.0.0.0 serves every interface, with no authentication')
+    serve.add_argument('--max-days', type=int, default=EXPORT_MAX_DAYS, help='longest range of one export')
+
+    args = parser.parse_args(argv)
+    {'serve': _serve}.get(args.command, _export)(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Batch AQI forecasts for every series at once.
+
+history is a (series, hours) array of hourly AQI ending at the latest hour,
+with NaN for missing hours. Both models run across all series together, one
+NumPy operation per time step rather than one model fit per city:
+
+- seasonal_naive repeats the last day, with a band from the spread of
+  day-over-day changes;
+- smoothing is additive seasonal exponential smoothing (level plus a daily
+  profile). Every series picks its own smoothing constants from a small
+  grid, which is evaluated in the same pass, by one-step-ahead error.
+
+Large batches are split across a process pool. Forecasts are returned as a
+dict of (series, horizon) arrays: mean, lower and upper (an 80% band).
+
+`python aqi_forecast.py --series 10000` times a refresh on synthetic data.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SEASON = 24
+BAND_Z = 1.2816    # two-sided 80% interval
+ALPHAS = np.array([0.1, 0.3, 0.5, 0.8])
+GAMMAS = np.array([0.05, 0.2, 0.5])
+POOL_MIN_SERIES = 5000
+MODELS = ('smoothing', 'seasonal_naive')
+
+def fill_gaps(history):
+    """Carry the last reading forward over missing hours; leading gaps take the series mean"""
+    filled = pd.DataFrame(history).ffill(axis=1).to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        means = np.nanmean(filled, axis=1) if filled.size else np.empty(0)
+    return np.where(np.isnan(filled), means[:, None], filled)
+
+def _band(mean, sigma, spread):
+    half = BAND_Z * sigma[:, None] * spread
+    return {
+        'mean': np.clip(mean, 0, 500),
+        'lower': np.clip(mean - half, 0, 500),
+        'upper': np.clip(mean + half, 0, 500),
+    }
+
+def seasonal_naive(history, horizon, season=SEASON):
+    """Tomorrow looks like today: each hour repeats the value one season earlier"""
+    history = fill_gaps(history)
+    steps = np.arange(horizon)
+    mean = history[:, history.shape[1] - season + steps % season]
+    with np.errstate(invalid='ignore'):
+        sigma = np.nanstd(history[:, season:] - history[:, :-season], axis=1)
+    return _band(mean, sigma, np.sqrt(steps // season + 1))
+
+def smoothing(history, horizon, season=SEASON, alphas=ALPHAS, gammas=GAMMAS):
+    """Additive seasonal exponential smoothing with per-series constants chosen from a grid"""
+    history = fill_gaps(history)
+    n_series, n_hours = history.shape
+    alpha = np.repeat(alphas, len(gammas))[:, None]
+    gamma = np.tile(gammas, len(alphas))[:, None]
+
+    first_day = history[:, :season]
+    level = np.broadcast_to(first_day.mean(axis=1), (len(alpha), n_series)).copy()
+    profile = np.broadcast_to(first_day - first_day.mean(axis=1, keepdims=True),
+                              (len(alpha), n_series, season)).copy()
+    sse = np.zeros((len(alpha), n_series))
+    for t in range(season, n_hours):
+        slot = t % season
+        observed = history[:, t]
+        error = observed - (level + profile[:, :, slot])
+        sse += error ** 2
+        level = alpha * (observed - profile[:, :, slot]) + (1 - alpha) * level
+        profile[:, :, slot] = gamma * (observed - level) + (1 - gamma) * profile[:, :, slot]
+
+    best = np.argmin(sse, axis=0)
+    rows = np.arange(n_series)
+    slots = (n_hours + np.arange(horizon)) % season
+    mean = level[best, rows][:, None] + profile[best, rows][:, slots]
+    sigma = np.sqrt(sse[best, rows] / max(1, n_hours - season))
+    spread = np.sqrt(1 + np.arange(horizon)[None, :] * alpha[best, 0][:, None] ** 2)
+    return _band(mean, sigma, spread)
+
+def forecast(history, horizon=72, model='smoothing', workers=None):
+    """Forecast every row of history `horizon` hours ahead.
+
+    workers sets the size of the process pool; by default batches of at
+    least POOL_MIN_SERIES series use one process per CPU, smaller batches
+    run in this process.
+    """
+    fit = {'smoothing': smoothing, 'seasonal_naive': seasonal_naive}[model]
+    history = np.asarray(history, dtype=float)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(history) >= POOL_MIN_SERIES else 1
+    if workers <= 1 or len(history) < 2 * workers:
+        return fit(history, horizon)
+
+    chunks = np.array_split(history, workers)
+    with ProcessPoolExecutor(workers) as pool:
+        parts = list(pool.map(fit, chunks, [horizon] * len(chunks)))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+def forecast_frame(cities, start, result):
+    """Long DataFrame (city, time, mean, lower, upper) of a forecast result"""
+    n_series, horizon = result['mean'].shape
+    frame = pd.DataFrame({key: values.ravel() for key, values in result.items()})
+    frame.insert(0, 'time', np.tile(pd.date_range(start, periods=horizon, freq='h'), n_series))
+    frame.insert(0, 'city', pd.Categorical(np.repeat(np.asarray(cities), horizon)))
+    return frame
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--series', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=14, help='days of hourly history per series')
+    parser.add_argument('--horizon', type=int, default=72)
+    parser.add_argument('--model', choices=MODELS, default='smoothing')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    hours = np.arange(args.days * SEASON)
+    base = rng.uniform(30, 350, size=(args.series, 1))
+    history = base * (1 + 0.3 * np.sin(2 * np.pi * hours / SEASON)) + rng.normal(0, 10, (args.series, len(hours)))
+    history[rng.random(history.shape) < 0.02] = np.nan
+
+    started = time.perf_counter()
+    result = forecast(history, args.horizon, args.model, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"{args.series} series x {len(hours)} h -> {args.horizon} h {args.model} forecast in {elapsed:.2f}s "
+          f"(mean band width {np.mean(result['upper'] - result['lower']):.1f} AQI)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""Concurrent ingestion of station readings from HTTP data sources.
+
+Every poll fetches all configured stations at once on a single asyncio event
+loop. Each source gets its own pool of keep-alive connections, a request-rate
+limit and retries with exponential backoff. Bounded queues between the
+fetchers and the writer apply backpressure, so a slow sink slows the fetchers
+down instead of buffering without limit. Responses are normalised into the
+reading store's schema (city, station, time, AQI and the pollutant columns
+that generate_24h_data produces) and written in batches off the event loop.
+
+Run it as a service next to the dashboard, which then reads the same store:
+
+    python aqi_ingest.py run sources.json --interval 3600
+    AQI_DATA_SOURCE=live streamlit run aqi_dash.py
+
+sources.json lists the sources and their stations::
+
+    {"sources": [{"name": "cpcb", "url": "https://.../stations/{station}",
+                  "rate_limit": 50, "max_connections": 32,
+                  "stations": [{"id": "DL009", "city": "Delhi"}, ...]}]}
+
+`python aqi_ingest.py bench --stations 10000` polls a local mock server to
+measure throughput without touching the network.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import aiohttp
+import pandas as pd
+from aiohttp import web
+
+from aqi_compute import POLLUTANTS, READING_DTYPES, aqi_from_array
+
+# Field names used by common feeds, mapped onto the dashboard's pollutant columns
+FIELD_ALIASES = {
+    'pm25': 'PM2.5', 'pm2_5': 'PM2.5', 'pm2.5': 'PM2.5',
+    'pm10': 'PM10',
+    'no2': 'NO2',
+    'so2': 'SO2',
+    'co': 'CO',
+    'o3': 'O3', 'ozone': 'O3',
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class Source:
+    """One HTTP data source: its station URL template and polling limits"""
+
+    def __init__(self, name, url, stations, rate_limit=50.0, max_connections=32):
+        self.name = name
+        self.url = url
+        self.stations = [s if isinstance(s, dict) else {'id': str(s)} for s in stations]
+        self.rate_limit = float(rate_limit)
+        self.max_connections = int(max_connections)
+
+def load_sources(path):
+    """Read the list of sources from a JSON config file"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    return [Source(**source) for source in config['sources']]
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second, in bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def reading_time(value):
+    """Hour of a reading time as a naive local timestamp.
+
+    value is a string (naive times are taken as local), epoch seconds, or
+    None for now; times with a zone are converted to the local zone first,
+    so feeds in different zones line up. Raises ValueError for anything else.
+    """
+    if value is None or value == '':
+        return pd.Timestamp(datetime.now()).floor('h')
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f"time: {value!r} is not a string or epoch seconds")
+    try:
+        time = pd.Timestamp(value) if isinstance(value, str) else pd.Timestamp(value, unit='s', tz='UTC')
+    except (OverflowError, ValueError):
+        raise ValueError(f"time: {value!r} is not a time") from None
+    if pd.isna(time):
+        raise ValueError(f"time: {value!r} is not a time")
+    if time.tzinfo is not None:
+        time = time.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None)
+    return time.floor('h')
+
+def normalize_reading(payload, station):
+    """Map one station response onto a reading row.
+
+    Accepts pollutant values either at the top level or under "pollutants",
+    keyed by the dashboard's column names or any FIELD_ALIASES spelling.
+    Raises ValueError for a payload that is not a reading, or whose time or
+    pollutant values do not parse.
+    """
+    values = payload.get('pollutants', payload) if isinstance(payload, dict) else None
+    if not isinstance(values, dict):
+        raise ValueError(f"Expected a JSON object of readings, got {type(values or payload).__name__}")
+    row = {
+        'city': station.get('city') or payload.get('city') or station['id'],
+        'station': station['id'],
+        'time': reading_time(payload.get('time')),
+    }
+    for key, value in values.items():
+        column = key if key in POLLUTANTS else FIELD_ALIASES.get(str(key).lower())
+        if column and value is not None:
+            try:
+                row[column] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key}: {value!r} is not a number") from None
+    return row
+
+def readings_batch(rows, standard='IN'):
+    """DataFrame of normalised rows with the hourly AQI computed from their concentrations"""
+    frame = pd.DataFrame(rows).reindex(columns=['city', 'station', 'time'] + POLLUTANTS)
+    frame.insert(3, 'AQI', aqi_from_array(frame[POLLUTANTS].to_numpy(dtype=float), POLLUTANTS, standard))
+    return frame.astype(READING_DTYPES)
+
+class Ingestor:
+    """Polls every station of every source concurrently and hands batches to a sink.
+
+    sink is a blocking callable taking a DataFrame (for example
+    ReadingStore.append); it runs in a worker thread so disk writes never
+    stall the event loop.
+    """
+
+    def __init__(self, sources, sink, retries=3, backoff=0.5, timeout=10.0, queue_size=10000, batch_size=2000):
+        self.sources = sources
+        self.sink = sink
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.stats = {'fetched': 0, 'retried': 0, 'failed': 0, 'invalid': 0, 'written': 0}
+        # Readings dropped as malformed, per station id, so one broken feed is easy to spot
+        self.invalid = Counter()
+        self._sessions = {}
+        self._limiters = {}
+
+    def _session(self, source):
+        # Sessions outlive a single poll so connections stay warm between polls
+        if source.name not in self._sessions:
+            connector = aiohttp.TCPConnector(limit=source.max_connections, keepalive_timeout=120)
+            self._sessions[source.name] = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._limiters[source.name] = RateLimiter(source.rate_limit)
+        return self._sessions[source.name]
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+    async def poll(self):
+        """Fetch every station once and write the results; returns the running stats"""
+        results = asyncio.Queue(maxsize=self.queue_size)
+        writer = asyncio.create_task(self._write(results))
+        try:
+            await asyncio.gather(*(self._poll_source(source, results) for source in self.sources))
+        finally:
+            await results.put(None)
+            await writer
+        return dict(self.stats)
+
+    async def run_forever(self, interval):
+        """Poll on a fixed interval until cancelled"""
+        try:
+            while True:
+                started = time.monotonic()
+                stats = await self.poll()
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} poll done in {time.monotonic() - started:.1f}s {stats}")
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+        finally:
+            await self.close()
+
+    async def _poll_source(self, source, results):
+        session = self._session(source)
+        jobs = asyncio.Queue(maxsize=source.max_connections * 2)
+        workers = [asyncio.create_task(self._worker(session, source, jobs, results))
+                   for _ in range(source.max_connections)]
+        for station in source.stations:
+            await jobs.put(station)
+        for _ in workers:
+            await jobs.put(None)
+        await asyncio.gather(*workers)
+
+    async def _worker(self, session, source, jobs, results):
+        while (station := await jobs.get()) is not None:
+            payload = await self._fetch(session, source, station['id'])
+            if payload is None:
+                continue
+            try:
+                row = normalize_reading(payload, station)
+            except ValueError:
+                self.stats['invalid'] += 1
+                self.invalid[station['id']] += 1
+                continue
+            await results.put(row)
+
+    async def _fetch(self, session, source, station_id):
+        url = source.url.format(station=station_id)
+        limiter = self._limiters[source.name]
+        for attempt in range(self.retries + 1):
+            await limiter.acquire()
+            try:
+                async with session.get(url) as response:
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        payload = await response.json(content_type=None)
+                        self.stats['fetched'] += 1
+                        return payload
+            except aiohttp.ClientResponseError:
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                pass
+
+            if attempt < self.retries:
+                self.stats['retried'] += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        self.stats['failed'] += 1
+        return None
+
+    async def _write(self, results):
+        batch = []
+        while (row := await results.get()) is not None:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, rows):
+        await asyncio.to_thread(self.sink, readings_batch(rows))
+        self.stats['written'] += len(rows)
+
+def mock_app(failure_rate=0.0, latency=0.0, seed=0):
+    """aiohttp app serving random station readings at /stations/{station}"""
+    rng = random.Random(seed)
+
+    async def station(request):
+        if latency:
+            await asyncio.sleep(latency)
+        if rng.random() < failure_rate:
+            return web.Response(status=503)
+        level = rng.uniform(30, 350)
+        return web.json_response({
+            'station': request.match_info['station'],
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'pollutants': {'pm25': level * 0.65, 'pm10': level * 0.85, 'no2': level * 0.28,
+                           'so2': level * 0.15, 'co': level * 0.012, 'o3': level * 0.22},
+        })
+
+    app = web.Application()
+    app.router.add_get('/stations/{station}', station)
+    return app
+
+async def _serve_mock(port, **options):
+    runner = web.AppRunner(mock_app(**options), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+async def _bench(args):
+    runner = await _serve_mock(args.port, failure_rate=args.failure_rate, latency=args.latency)
+    stations = [{'id': f'S{i:06d}', 'city': f'City {i % 500}'} for i in range(args.stations)]
+    source = Source('mock', f'http://127.0.0.1:{args.port}/stations/{{station}}', stations,
+                    rate_limit=args.rate_limit, max_connections=args.connections)
+    rows = []
+    ingestor = Ingestor([source], lambda frame: rows.append(len(frame)), backoff=0.05)
+    try:
+        started = time.perf_counter()
+        stats = await ingestor.poll()
+        elapsed = time.perf_counter() - started
+    finally:
+        await ingestor.close()
+        await runner.cleanup()
+    print(f"{args.stations} stations in {elapsed:.2f}s ({args.stations / elapsed:.0f}/s), "
+          f"{len(rows)} batches, {stats}")
+
+async def _run(args):
+    from aqi_store import ReadingStore
+    store = ReadingStore(Path(args.data_dir) / 'readings')
+    await Ingestor(load_sources(args.config), store.append).run_forever(args.interval)
+
+async def _mock(args):
+    await _serve_mock(args.port, failure_rate=args.failure_rate, latency=args.latency)
+    print(f"Mock stations on http://127.0.0.1:{args.port}/stations/{{station}}")
+    await asyncio.Event().wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='poll the configured sources into the reading store')
+    run.add_argument('config', help='JSON file listing sources and stations')
+    run.add_argument('--interval', type=float, default=3600, help='seconds between polls')
+    run.add_argument('--data-dir', default=os.environ.get('AQI_DATA_DIR', Path(__file__).with_name('data')))
+
+    for name, help_text in (('mock', 'serve mock station readings'), ('bench', 'poll a local mock server')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--port', type=int, default=8765)
+        command.add_argument('--failure-rate', type=float, default=0.0)
+        command.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    bench = commands.choices['bench']
+    bench.add_argument('--stations', type=int, default=10000)
+    bench.add_argument('--connections', type=int, default=100)
+    bench.add_argument('--rate-limit', type=float, default=100000)
+
+    args = parser.parse_args(argv)
+    asyncio.run({'run': _run, 'mock': _mock, 'bench': _bench}[args.command](args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Opt-in section timings and payload counters for the dashboard.
+
+A Profiler collects, for every named section of the page, how often it ran
+and its total and longest wall time, plus the number and bytes of the
+payloads (chart JSON, HTML markdown) sent to the browser. Sections may nest
+and their times are inclusive. One Profiler is shared by every session of
+a dashboard process, and its counters can be exported in the Prometheus
+text format or as JSON:
+
+    AQI_PROFILE=1 AQI_PROFILE_FILE=/var/lib/node_exporter/aqi.prom streamlit run aqi_dash.py
+
+AQI_PROFILE turns the instrumentation on for every session, and opening the
+dashboard with ?profile=1 turns it on for that session and shows the debug
+panel. AQI_PROFILE_FILE is rewritten after every run, as Prometheus text
+(for a node_exporter textfile collector) or as JSON when it ends in .json.
+With profiling off, a section is a shared no-op context manager.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+PROFILE_ENABLED = os.environ.get('AQI_PROFILE', '') not in ('', '0')
+PROFILE_FILE = os.environ.get('AQI_PROFILE_FILE')
+NO_SECTION = nullcontext()
+METRIC_PREFIX = 'aqi_dash'
+
+class Profiler:
+    """Thread-safe section timings and payload counters, shared by every session"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._sections = {}    # name -> [runs, total seconds, max seconds]
+        self._payloads = {}    # kind -> [items, bytes]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def section(self, name):
+        """Time the body of a with block as one run of section name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            entry = self._sections.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def payload(self, kind, nbytes):
+        """Count one payload of nbytes bytes sent to the browser"""
+        with self._lock:
+            entry = self._payloads.setdefault(kind, [0, 0])
+            entry[0] += 1
+            entry[1] += nbytes
+
+    def reset(self):
+        with self._lock:
+            self._sections.clear()
+            self._payloads.clear()
+            self.started = time.time()
+
+    def snapshot(self, cache_stats=None):
+        """Plain dict of every counter, plus the data cache's stats when given"""
+        with self._lock:
+            snapshot = {
+                'started': self.started,
+                'sections': {name: {'runs': runs, 'seconds': total, 'max_seconds': longest}
+                             for name, (runs, total, longest) in self._sections.items()},
+                'payloads': {kind: {'items': items, 'bytes': nbytes}
+                             for kind, (items, nbytes) in self._payloads.items()},
+            }
+        if cache_stats is not None:
+            snapshot['cache'] = dict(cache_stats)
+        return snapshot
+
+    def to_json(self, cache_stats=None):
+        return json.dumps(self.snapshot(cache_stats), indent=1)
+
+    def to_prometheus(self, cache_stats=None):
+        """Counters in the Prometheus text exposition format"""
+        snapshot = self.snapshot(cache_stats)
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{METRIC_PREFIX}_{name} {value}")
+
+        sections, payloads = snapshot['sections'], snapshot['payloads']
+        metric('section_runs_total', 'counter', 'Runs of each page section.',
+               [({'section': name}, entry['runs']) for name, entry in sections.items()])
+        metric('section_seconds_total', 'counter', 'Wall time spent in each page section, inclusive of nested ones.',
+               [({'section': name}, f"{entry['seconds']:.6f}") for name, entry in sections.items()])
+        metric('section_seconds_max', 'gauge', 'Longest single run of each page section.',
+               [({'section': name}, f"{entry['max_seconds']:.6f}") for name, entry in sections.items()])
+        metric('payload_items_total', 'counter', 'Payloads sent to the browser, by kind.',
+               [({'kind': kind}, entry['items']) for kind, entry in payloads.items()])
+        metric('payload_bytes_total', 'counter', 'Bytes of payloads sent to the browser, by kind.',
+               [({'kind': kind}, entry['bytes']) for kind, entry in payloads.items()])
+        if 'cache' in snapshot:
+            metric('cache_hits_total', 'counter', 'Data cache hits.', [({}, snapshot['cache']['hits'])])
+            metric('cache_misses_total', 'counter', 'Data cache misses.', [({}, snapshot['cache']['misses'])])
+            metric('cache_entries', 'gauge', 'Entries in the data cache.', [({}, snapshot['cache']['entries'])])
+        metric('profile_start_time_seconds', 'gauge', 'Unix time the counters started from.',
+               [({}, f"{snapshot['started']:.3f}")])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, cache_stats=None):
+        """Atomically write the counters to path: JSON for .json files, Prometheus text otherwise"""
+        path = Path(path)
+        text = self.to_json(cache_stats) if path.suffix == '.json' else self.to_prometheus(cache_stats)
+        tmp = path.with_suffix(f'.{uuid.uuid4().hex[:8]}.tmp')
+        tmp.write_text(text)
+        os.replace(tmp, path)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
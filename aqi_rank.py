@@ -0,0 +1,217 @@
+"""Global AQI ranking of every city and station, paged and filtered.
+
+Ranking holds one AQI per location (every city of the registry and every
+station of the catalogue) as a NumPy array. A page of the ranking is a
+partial selection: np.argpartition finds the locations ranked up to the end
+of the page and only those are sorted, so the first pages cost O(n) however
+large the catalogue, and pages past the middle are selected from the other
+end. Filters by kind, region and country select whole (kind, country)
+groups, whose positions are cached.
+
+The summary (highest, lowest, average and unhealthy count) is kept per
+group and updated by update() in proportion to the locations that changed:
+counts and sums by difference, extremes by comparison with the new values,
+rescanning a group only when its highest or lowest location moved back
+towards the rest. A summary of a filter combines its groups' statistics.
+`python aqi_bench.py --only ranking` times both over 100k locations.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+UNHEALTHY_AQI = 100
+
+# Region of each country of the registry; other countries are ranked under 'Other'
+COUNTRY_REGIONS = {
+    'India': 'Asia', 'China': 'Asia', 'Japan': 'Asia', 'South Korea': 'Asia', 'Thailand': 'Asia',
+    'Singapore': 'Asia',
+    'UAE': 'Middle East & Africa', 'Egypt': 'Middle East & Africa', 'Nigeria': 'Middle East & Africa',
+    'United Kingdom': 'Europe', 'France': 'Europe', 'Germany': 'Europe', 'Italy': 'Europe', 'Spain': 'Europe',
+    'Netherlands': 'Europe', 'Russia': 'Europe',
+    'United States': 'Americas', 'Canada': 'Americas', 'Mexico': 'Americas', 'Brazil': 'Americas',
+    'Argentina': 'Americas',
+    'Australia': 'Oceania',
+}
+
+def location_ids(kind, names, cities=None):
+    """Location ids as used by alert_entities: city:<name>, or station:<city>/<name>"""
+    names = np.asarray(names, dtype=str)
+    if kind == 'city':
+        return pd.Index(np.char.add('city:', names))
+    return pd.Index(np.char.add(np.char.add(np.char.add('station:', np.asarray(cities, dtype=str)), '/'), names))
+
+def ranking_locations(cities, stations, city_aqi=None):
+    """Every city and station with its label, kind, city, country and region, indexed by location id.
+
+    Cities take city_aqi (default their base AQI) and stations their
+    catalogue AQI; both are in the 'aqi' column.
+    """
+    country = cities['country'].astype(str)
+    station_city = stations['city'].astype(str).to_numpy()
+    station_country = country.reindex(station_city).fillna('Other').to_numpy()
+    locations = pd.DataFrame({
+        'label': np.concatenate([cities.index.to_numpy(dtype=str) + ' ' + cities['flag'].astype(str).to_numpy(),
+                                 stations['name'].astype(str).to_numpy() + ' · ' + station_city]),
+        'kind': np.repeat(['city', 'station'], [len(cities), len(stations)]),
+        'city': np.concatenate([cities.index.to_numpy(dtype=str), station_city]),
+        'country': np.concatenate([country.to_numpy(), station_country]),
+        'aqi': np.concatenate([cities['base_aqi'].to_numpy(dtype=float) if city_aqi is None
+                               else np.asarray(city_aqi, dtype=float),
+                               stations['aqi'].to_numpy(dtype=float)]),
+    }, index=location_ids('city', cities.index).append(location_ids('station', stations['name'], station_city)))
+    locations['region'] = locations['country'].map(COUNTRY_REGIONS).fillna('Other')
+    locations = locations[~locations.index.duplicated()]
+    return locations.astype({column: 'category' for column in ('kind', 'city', 'country', 'region')})
+
+class Ranking:
+    """AQI ranking of a fixed set of locations whose values change over time.
+
+    locations is a frame like ranking_locations() returns. update() replaces
+    the AQI of some locations; page() and summary() read a consistent state
+    under the same lock, so one ranking can be shared by every session.
+    """
+
+    def __init__(self, locations):
+        self.locations = locations.drop(columns='aqi')
+        self.key = None
+        self._aqi = locations['aqi'].to_numpy(dtype=float).copy()
+        self._lock = threading.Lock()
+        self._positions = {}
+
+        # One group per (kind, country); members are the group's positions, group after group
+        groups = self.locations[['kind', 'country', 'region']].astype(str)
+        keys = pd.MultiIndex.from_frame(groups[['kind', 'country']])
+        self._group, unique = pd.factorize(keys)
+        self.groups = groups.drop_duplicates(['kind', 'country']).set_index(pd.RangeIndex(len(unique)))
+        self._members = np.argsort(self._group, kind='stable')
+        self._bounds = np.searchsorted(self._group[self._members], np.arange(len(unique) + 1))
+
+        n_groups = len(unique)
+        self._count = np.bincount(self._group, minlength=n_groups)
+        self._total = np.bincount(self._group, self._aqi, minlength=n_groups)
+        self._unhealthy = np.bincount(self._group, self._aqi > UNHEALTHY_AQI, minlength=n_groups).astype(np.int64)
+        self._high = np.empty(n_groups)
+        self._high_at = np.empty(n_groups, dtype=np.int64)
+        self._low = np.empty(n_groups)
+        self._low_at = np.empty(n_groups, dtype=np.int64)
+        self._rescan(np.arange(n_groups))
+
+    def __len__(self):
+        return len(self._aqi)
+
+    @property
+    def regions(self):
+        return sorted(self.groups['region'].unique())
+
+    def countries(self, region=None):
+        groups = self.groups if region is None else self.groups[self.groups['region'] == region]
+        return sorted(groups['country'].unique())
+
+    def _rescan(self, groups):
+        for group in groups:
+            members = self._members[self._bounds[group]:self._bounds[group + 1]]
+            values = self._aqi[members]
+            high, low = values.argmax(), values.argmin()
+            self._high[group], self._high_at[group] = values[high], members[high]
+            self._low[group], self._low_at[group] = values[low], members[low]
+
+    def update(self, aqi, key=None):
+        """Set the AQI of the locations in the Series aqi (indexed by location id).
+
+        With a key, an update whose key matches the last one is skipped, so
+        every session can apply the refresh it sees and only the first does.
+        """
+        with self._lock:
+            if key is not None and key == self.key:
+                return
+            positions = self.locations.index.get_indexer(aqi.index)
+            if (positions < 0).any():
+                raise KeyError(f"Unknown locations: {list(aqi.index[positions < 0][:10])}")
+            values = aqi.to_numpy(dtype=float)
+            old = self._aqi[positions]
+            group = self._group[positions]
+            self._aqi[positions] = values
+
+            n_groups = len(self.groups)
+            self._total += np.bincount(group, values - old, minlength=n_groups)
+            self._unhealthy += np.bincount(group, (values > UNHEALTHY_AQI).astype(int)
+                                           - (old > UNHEALTHY_AQI), minlength=n_groups).astype(np.int64)
+
+            # Groups whose highest (lowest) location fell (rose) need a rescan; new extremes replace the old
+            stale = np.unique(np.concatenate([group[(positions == self._high_at[group]) & (values < old)],
+                                              group[(positions == self._low_at[group]) & (values > old)]]))
+            order = np.argsort(values, kind='stable')
+            higher = order[values[order] > self._high[group[order]]]
+            self._high[group[higher]], self._high_at[group[higher]] = values[higher], positions[higher]
+            lower = order[::-1][values[order[::-1]] < self._low[group[order[::-1]]]]
+            self._low[group[lower]], self._low_at[group[lower]] = values[lower], positions[lower]
+            self._rescan(stale)
+            self.key = key
+
+    def _selected(self, kind=None, region=None, country=None):
+        """Group ids matching the filters"""
+        mask = np.ones(len(self.groups), dtype=bool)
+        for column, value in (('kind', kind), ('region', region), ('country', country)):
+            if value is not None:
+                mask &= (self.groups[column] == value).to_numpy()
+        return np.flatnonzero(mask)
+
+    def positions(self, kind=None, region=None, country=None):
+        """Positions of the locations matching the filters"""
+        key = (kind, region, country)
+        positions = self._positions.get(key)
+        if positions is None:
+            selected = self._selected(kind, region, country)
+            positions = np.concatenate([self._members[self._bounds[g]:self._bounds[g + 1]] for g in selected]
+                                       or [np.empty(0, dtype=np.int64)])
+            positions = self._positions[key] = np.sort(positions)
+        return positions
+
+    def page(self, page=0, size=25, ascending=False, kind=None, region=None, country=None):
+        """DataFrame of one page of the ranking, most polluted first (cleanest first if ascending).
+
+        Ranks count from 1 within the filtered locations; ties keep catalogue order.
+        """
+        positions = self.positions(kind, region, country)
+        with self._lock:
+            values = self._aqi[positions]
+        n = len(positions)
+        start, end = min(page * size, n), min((page + 1) * size, n)
+        key = values if ascending else -values
+        if end - start and n - start < end:
+            # Pages past the middle are the first pages of the opposite order, read backwards
+            reverse = n - 1 - _ranked(-key[::-1], n - start)
+            order = reverse[n - end:][::-1]
+        else:
+            order = _ranked(key, end)[start:]
+
+        rows = self.locations.iloc[positions[order]]
+        return rows[['label', 'kind', 'city', 'country', 'region']].assign(
+            aqi=values[order], rank=np.arange(start + 1, start + len(order) + 1)).rename_axis('id')
+
+    def summary(self, kind=None, region=None, country=None):
+        """Highest and lowest location, average AQI and unhealthy count of the filtered locations"""
+        selected = self._selected(kind, region, country)
+        with self._lock:
+            count = int(self._count[selected].sum())
+            if not count:
+                return {'count': 0, 'average': np.nan, 'unhealthy': 0, 'highest': None, 'lowest': None}
+            high = selected[np.argmax(self._high[selected])]
+            low = selected[np.argmin(self._low[selected])]
+            return {
+                'count': count,
+                'average': float(self._total[selected].sum() / count),
+                'unhealthy': int(self._unhealthy[selected].sum()),
+                'highest': (self.locations['label'].iat[self._high_at[high]], float(self._high[high])),
+                'lowest': (self.locations['label'].iat[self._low_at[low]], float(self._low[low])),
+            }
+
+def _ranked(key, k):
+    """Indices of the k smallest keys in order, ties in index order, by partial selection then a sort of those k"""
+    if k >= len(key):
+        return np.argsort(key, kind='stable')
+    boundary = np.partition(key, k - 1)[k - 1]
+    below = np.flatnonzero(key < boundary)
+    first = np.concatenate([below, np.flatnonzero(key == boundary)[:k - len(below)]])
+    return first[np.argsort(key[first], kind='stable')]
@@ -0,0 +1,270 @@
+"""Multi-resolution rollups of hourly AQI for long-range history.
+
+Hourly AQI is summarised per city into day, week and month buckets. Each
+bucket holds the count, sum, min and max of its hours plus a fixed-bin
+histogram. All of these merge by addition (or min/max), so any run of
+buckets reduces to the same statistics. Percentiles are read off the
+histogram, accurate to within one bin.
+
+Day buckets are the source of truth. catch_up() compares the reading
+store's manifest with the one it last folded. Every day of a partition
+that gained or compacted files is aggregated again from the store, and
+replaces its day buckets, late readings included. The weeks and months
+holding those days are then reduced again from their day buckets. Buckets
+are replaced rather than added to, so a catch-up that is interrupted and
+run again gives the same rollups.
+
+Buckets live in small Parquet files, ``<root>/<level>/<partition>.parquet``
+(days partitioned by month, weeks and months by year), which are rewritten
+atomically when new hours land in them. The hourly level is the reading
+store itself. A query picks the finest level whose bucket count fits the
+points the chart can show, so its cost and payload depend on the chart
+width rather than on how much history is stored.
+"""
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Approximate bucket length of every level in hours, finest first
+LEVELS = {'hour': 1, 'day': 24, 'week': 24 * 7, 'month': 24 * 30}
+STORED_LEVELS = ['day', 'week', 'month']
+HIST_BIN = 10
+HIST_BINS = 50    # AQI 0-500; higher values fall into the last bin
+PERCENTILES = (50, 90, 95)
+SCHEMA = pa.schema([
+    ('city', pa.string()), ('start', pa.timestamp('ns')), ('count', pa.int64()),
+    ('sum', pa.float64()), ('min', pa.float64()), ('max', pa.float64()),
+    ('hist', pa.list_(pa.int64(), HIST_BINS)),
+])
+
+def bucket_start(times, level):
+    """Start of the level's bucket containing each time; weeks start on Monday"""
+    hours = np.asarray(times, dtype='datetime64[h]')
+    if level == 'hour':
+        starts = hours
+    elif level == 'day':
+        starts = hours.astype('datetime64[D]')
+    elif level == 'week':
+        days = hours.astype('datetime64[D]').astype(np.int64)
+        starts = (days - (days + 3) % 7).astype('datetime64[D]')
+    elif level == 'month':
+        starts = hours.astype('datetime64[M]')
+    else:
+        raise ValueError(f"Unknown rollup level {level!r}; expected one of {list(LEVELS)}")
+    return starts.astype('datetime64[ns]')
+
+def choose_level(start, end, max_points):
+    """Finest level with at most max_points buckets between start and end"""
+    hours = (pd.Timestamp(end) - pd.Timestamp(start)) / pd.Timedelta(hours=1)
+    for level, length in LEVELS.items():
+        if hours / length <= max_points:
+            return level
+    return 'month'
+
+def _groups(city, start):
+    """Order sorting rows by (city, start), and where each key's run starts in that order"""
+    city_codes, _ = pd.factorize(city, sort=True)
+    start_codes, starts = pd.factorize(start, sort=True)
+    keys = city_codes.astype(np.int64) * max(len(starts), 1) + start_codes
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+    return order, first
+
+def aggregate(readings, level, city='city', time='time', value='AQI'):
+    """Bucket aggregates (city, start, count, sum, min, max, hist) of hourly readings"""
+    values = readings[value].to_numpy(dtype=float)
+    keep = ~np.isnan(values) & (values >= 0)
+    values = values[keep]
+    cities = np.asarray(readings[city], dtype=object)[keep]
+    starts = bucket_start(readings[time].to_numpy()[keep], level)
+
+    if not len(values):
+        return _from_table(SCHEMA.empty_table())
+
+    order, first = _groups(cities, starts)
+    values = values[order]
+    is_first = np.zeros(len(values), dtype=bool)
+    is_first[first] = True
+    group = np.cumsum(is_first) - 1
+    bins = np.minimum(values // HIST_BIN, HIST_BINS - 1).astype(np.int64)
+    hist = np.bincount(group * HIST_BINS + bins, minlength=len(first) * HIST_BINS)
+    return {
+        'city': cities[order][first],
+        'start': starts[order][first],
+        'count': np.diff(np.r_[first, len(values)]),
+        'sum': np.add.reduceat(values, first),
+        'min': np.minimum.reduceat(values, first),
+        'max': np.maximum.reduceat(values, first),
+        'hist': hist.reshape(len(first), HIST_BINS),
+    }
+
+def merge(*parts):
+    """Combine aggregates, merging buckets that share a city and start"""
+    parts = [part for part in parts if part is not None]
+    combined = {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+    if not len(combined['start']):
+        return combined
+    order, first = _groups(combined['city'], combined['start'])
+    return {
+        'city': combined['city'][order][first],
+        'start': combined['start'][order][first],
+        'count': np.add.reduceat(combined['count'][order], first),
+        'sum': np.add.reduceat(combined['sum'][order], first),
+        'min': np.minimum.reduceat(combined['min'][order], first),
+        'max': np.maximum.reduceat(combined['max'][order], first),
+        'hist': np.add.reduceat(combined['hist'][order], first, axis=0),
+    }
+
+def percentiles(hist, low, high, qs=PERCENTILES):
+    """Percentiles per histogram row, interpolated within bins and clipped to [low, high]"""
+    cumulative = np.cumsum(hist, axis=1)
+    result = {}
+    for q in qs:
+        target = cumulative[:, -1] * q / 100
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), HIST_BINS - 1)
+        rows = np.arange(len(hist))
+        below = cumulative[rows, index] - hist[rows, index]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.nan_to_num((target - below) / hist[rows, index])
+        result[f'p{q}'] = np.clip((index + fraction) * HIST_BIN, low, high)
+    return result
+
+def stats(aggregates):
+    """DataFrame of count, mean, min, max and percentiles per city and bucket"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = aggregates['sum'] / aggregates['count']
+    frame = pd.DataFrame({
+        'city': pd.Categorical(aggregates['city']), 'start': aggregates['start'], 'count': aggregates['count'],
+        'mean': mean, 'min': aggregates['min'], 'max': aggregates['max'],
+        **percentiles(aggregates['hist'], aggregates['min'], aggregates['max']),
+    })
+    return frame.sort_values(['city', 'start'], ignore_index=True)
+
+def _to_table(aggregates):
+    hist = pa.FixedSizeListArray.from_arrays(pa.array(aggregates['hist'].ravel(), pa.int64()), HIST_BINS)
+    columns = [pa.array(aggregates[field.name], field.type) for field in SCHEMA if field.name != 'hist']
+    return pa.Table.from_arrays(columns + [hist], schema=SCHEMA)
+
+def _from_table(table):
+    aggregates = {column: table[column].to_numpy() for column in ('start', 'count', 'sum', 'min', 'max')}
+    aggregates['city'] = np.asarray(table['city'].to_pylist(), dtype=object)
+    aggregates['start'] = aggregates['start'].astype('datetime64[ns]')
+    hist = table['hist'].combine_chunks().flatten().to_numpy(zero_copy_only=False)
+    aggregates['hist'] = hist.reshape(len(table), HIST_BINS)
+    return aggregates
+
+class RollupStore:
+    """Day, week and month rollups of a ReadingStore's hourly AQI, kept current by catch_up()"""
+
+    def __init__(self, store, root=None, value='AQI'):
+        self.store = store
+        self.root = Path(root) if root is not None else store.root.parent / 'rollups'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.value = value
+        self.lock = threading.RLock()
+
+    def _partition(self, starts, level):
+        return pd.DatetimeIndex(starts).strftime('%Y-%m' if level == 'day' else '%Y')
+
+    def _path(self, level, partition):
+        return self.root / level / f"{partition}.parquet"
+
+    def folded(self):
+        """The reading store manifest the rollups were last brought up to date with"""
+        path = self.root / 'folded.json'
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def _set_folded(self, manifest):
+        path = self.root / 'folded.json'
+        tmp = path.with_suffix(f'.{uuid.uuid4().hex[:8]}.tmp')
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, path)
+
+    def _replace(self, level, new, starts):
+        """Make new the level's buckets starting at `starts`, dropping whatever those buckets held"""
+        partitions = self._partition(starts, level)
+        new_partitions = self._partition(new['start'], level)
+        for partition in np.unique(partitions):
+            path = self._path(level, partition)
+            parts = [{column: values[np.asarray(new_partitions == partition)] for column, values in new.items()}]
+            if path.exists():
+                current = _from_table(pq.read_table(path))
+                kept = ~np.isin(current['start'], starts)
+                parts.append({column: values[kept] for column, values in current.items()})
+
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            pq.write_table(_to_table(merge(*parts)), tmp)
+            os.replace(tmp, path)
+
+    def update(self, days):
+        """Aggregate the given days (all in one month) again from the reading store, at every level"""
+        days = pd.DatetimeIndex(days).normalize().unique().sort_values()
+        readings = self.store.read(start=days[0], end=days[-1] + pd.Timedelta(hours=23), columns=[self.value])
+        if len(readings):
+            readings = readings[readings[self.store.time].dt.normalize().isin(days)]
+        day_starts = days.to_numpy(dtype='datetime64[ns]')
+        with self.lock:
+            self._replace('day', aggregate(readings, 'day', self.store.city, self.store.time, self.value), day_starts)
+            for level in STORED_LEVELS[1:]:
+                # Weeks and months are reductions of their day buckets
+                starts = np.unique(bucket_start(day_starts, level))
+                daily = self.aggregates(None, starts[0], pd.Timestamp(starts[-1]) + pd.Timedelta(days=31), 'day')
+                inside = np.isin(bucket_start(daily['start'], level), starts)
+                daily = {column: values[inside] for column, values in daily.items()}
+                daily['start'] = bucket_start(daily['start'], level)
+                self._replace(level, merge(daily), starts)
+
+    def catch_up(self):
+        """Aggregate again every day of the store partitions that changed since the last catch-up, a month at a time"""
+        with self.lock:
+            manifest = self.store.manifest()
+            folded = self.folded()
+            changed = [self.store.partition_days(name) for name, files in manifest.items() if folded.get(name) != files]
+            if changed:
+                days = changed[0].append(changed[1:]).unique().sort_values()
+                for _, month in pd.Series(days, index=days).groupby(days.to_period('M')):
+                    self.update(month)
+            self._set_folded(manifest)
+
+    def rebuild(self):
+        """Discard the rollups and recompute them from the whole reading store"""
+        with self.lock:
+            for path in self.root.glob('*/*.parquet'):
+                path.unlink()
+            (self.root / 'folded.json').unlink(missing_ok=True)
+            self.catch_up()
+
+    def aggregates(self, cities, start, end, level):
+        """Raw bucket aggregates for the given cities and buckets starting in [start, end]"""
+        start = pd.Timestamp(bucket_start([pd.Timestamp(start).to_datetime64()], level)[0])
+        end = pd.Timestamp(end)
+        if level == 'hour':
+            readings = self.store.read(cities, start, end, columns=[self.value])
+            return aggregate(readings, level, self.store.city, self.store.time, self.value)
+
+        first, last = self._partition([start, end], level)
+        files = [path for path in sorted((self.root / level).glob('*.parquet')) if first <= path.stem <= last]
+        condition = (ds.field('start') >= start) & (ds.field('start') <= end)
+        if cities is not None:
+            condition &= ds.field('city').isin(list(cities))
+        return _from_table(ds.dataset(files, schema=SCHEMA, format='parquet').to_table(filter=condition))
+
+    def read(self, cities, start, end, level):
+        """Statistics per city and level bucket between start and end"""
+        return stats(self.aggregates(cities, start, end, level))
+
+    def summary(self, cities, start, end, level):
+        """Statistics per city over the whole range, reduced from its level buckets"""
+        aggregates = self.aggregates(cities, start, end, level)
+        aggregates['start'] = np.full(len(aggregates['start']), pd.Timestamp(start).to_datetime64())
+        return stats(merge(aggregates))
@@ -0,0 +1,101 @@
+"""Cold-start timing report for the dashboard.
+
+Starts a fresh interpreter, imports streamlit as a server worker does, then
+renders the dashboard once and again with Streamlit's AppTest harness under
+``python -X importtime``. Reports the first (cold) and second (warm) render
+times, the time until the header, sidebar and KPI cards of the cold render
+are out (the shell a new session sees first, timed by the dashboard's
+profiler in a second, profiled run) and, for the first render, the import
+time spent per top-level package, so a new heavy import shows up as a line
+of its own:
+
+    python aqi_startup.py [--script aqi_dash.py] [--top 15] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+WORKER = r'''
+import sys, time
+started = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+print(f"@@ server_start {time.perf_counter() - started}", file=sys.stderr, flush=True)
+
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+started = time.perf_counter()
+app.run()
+print(f"@@ first_render {time.perf_counter() - started}", file=sys.stderr, flush=True)
+started = time.perf_counter()
+app.run()
+print(f"@@ warm_render {time.perf_counter() - started}", file=sys.stderr, flush=True)
+for error in app.exception:
+    print(f"@@ exception {error.message!r}", file=sys.stderr, flush=True)
+'''
+
+def startup_report(script):
+    """Timings (seconds) of one cold start of script, with first-render import time per package"""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', WORKER, str(script)],
+                             capture_output=True, text=True, cwd=Path(script).resolve().parent)
+    report = {'script': str(script), 'imports': defaultdict(float), 'exceptions': []}
+    in_first_render = False
+    for line in process.stderr.splitlines():
+        if line.startswith('@@ '):
+            _, event, value = line.split(' ', 2)
+            if event == 'exception':
+                report['exceptions'].append(value)
+            else:
+                report[event] = float(value)
+                in_first_render = event == 'server_start'
+        elif line.startswith('import time:') and in_first_render:
+            self_us, _, name = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                report['imports'][name.strip().split('.')[0]] += int(self_us) / 1e6
+    if process.returncode:
+        raise RuntimeError(f"startup worker failed:\n{process.stderr[-2000:]}")
+    report['imports'] = dict(sorted(report['imports'].items(), key=lambda item: -item[1]))
+    report['import_total'] = sum(report['imports'].values())
+    report['shell'] = shell_time(script)
+    return report
+
+def shell_time(script):
+    """Seconds until the cold render's KPI cards are out, from the profiler's 'shell' section"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / 'profile.json'
+        env = dict(os.environ, AQI_PROFILE='1', AQI_PROFILE_FILE=str(path))
+        subprocess.run([sys.executable, '-c', WORKER, str(script)], capture_output=True, check=True,
+                       env=env, cwd=Path(script).resolve().parent)
+        shell = json.loads(path.read_text())['sections'].get('shell')
+    # The cold render is the slower of the two runs
+    return shell and shell['max_seconds']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--script', default=Path(__file__).with_name('aqi_dash.py'))
+    parser.add_argument('--top', type=int, default=15, help='packages to list')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = startup_report(args.script)
+    if args.json:
+        print(json.dumps(report, indent=1))
+        return
+    print(f"server start    {report['server_start'] * 1e3:8.0f} ms")
+    print(f"first render    {report['first_render'] * 1e3:8.0f} ms  "
+          f"(of which imports {report['import_total'] * 1e3:.0f} ms)")
+    if report['shell'] is not None:
+        print(f"  shell out     {report['shell'] * 1e3:8.0f} ms  (header, sidebar and KPI cards)")
+    print(f"warm render     {report['warm_render'] * 1e3:8.0f} ms")
+    print("\nfirst-render imports by package:")
+    for package, seconds in list(report['imports'].items())[:args.top]:
+        print(f"  {package:<24}{seconds * 1e3:8.1f} ms")
+    for error in report['exceptions']:
+        print(f"\nexception: {error}")
+
+if __name__ == '__main__':
+    main()
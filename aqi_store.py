@@ -0,0 +1,252 @@
+"""Append-only, time-partitioned Parquet store for hourly readings.
+
+Recent readings live under ``<root>/date=YYYY-MM-DD/`` with one row per city
+and hour. Every append writes new files and never rewrites existing ones.
+compact() merges a finished day's parts into one file, and compact_month()
+folds the days of a finished month into ``<root>/month=YYYY-MM/``, sorted by
+city and time so row-group statistics let readers skip other cities.
+
+Range reads only open the partitions overlapping the requested window and
+push city, time and column selection down to the Parquet reader, so the cost
+of a read follows the window asked for rather than the length of the history.
+scan() streams the same selection as record batches for bulk exports.
+"""
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from aqi_compute import READING_DTYPES
+
+ROW_GROUP_SIZE = 16384
+SCAN_BATCH_SIZE = 65536
+
+class ReadingStore:
+    """Hourly readings on disk, partitioned by day and, once complete, by month"""
+
+    def __init__(self, root, time='time', city='city'):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.time = time
+        self.city = city
+        # Held by writers so concurrent sessions do not append the same hours twice
+        self.lock = threading.RLock()
+        # Held while a compaction swaps its files and while readers list and open files,
+        # so a reader sees each compaction either not started or finished
+        self._swap = threading.Lock()
+
+    def _day_dir(self, day):
+        return self.root / f"date={pd.Timestamp(day):%Y-%m-%d}"
+
+    def _month_dir(self, month):
+        return self.root / f"month={pd.Timestamp(month):%Y-%m}"
+
+    def _partitions(self, start=None, end=None):
+        """(first day, directory) of every partition overlapping [start, end], oldest first"""
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        partitions = []
+        for path in self.root.glob('month=*'):
+            first = pd.Timestamp(path.name[len('month='):])
+            if (start is None or first + pd.offsets.MonthBegin(1) > start) and (end is None or first <= end):
+                partitions.append((first, path))
+        partitions += [(day, self._day_dir(day)) for day in self.days(start, end)]
+        return sorted(partitions)
+
+    def manifest(self):
+        """File names of every partition, keyed by the partition's folder name.
+
+        A partition's entry changes whenever readings are appended to it or
+        it is compacted, so comparing two manifests tells which partitions
+        may hold readings that were not there before.
+        """
+        with self._swap:
+            return {folder.name: sorted(path.name for path in folder.glob('*.parquet'))
+                    for _, folder in self._partitions()}
+
+    @staticmethod
+    def partition_days(name):
+        """Days a partition folder (as named in the manifest) covers"""
+        kind, _, value = name.partition('=')
+        if kind == 'month':
+            month = pd.Period(value, 'M')
+            return pd.date_range(month.start_time, month.end_time.normalize(), freq='D')
+        return pd.DatetimeIndex([pd.Timestamp(value)])
+
+    def days(self, start=None, end=None):
+        """Day partitions present in the store, oldest first, within [start, end]"""
+        start = pd.Timestamp(start).normalize() if start is not None else None
+        end = pd.Timestamp(end).normalize() if end is not None else None
+        days = []
+        for path in self.root.glob('date=*'):
+            day = pd.Timestamp(path.name[len('date='):])
+            if (start is None or day >= start) and (end is None or day <= end):
+                days.append(day)
+        return sorted(days)
+
+    def append(self, readings):
+        """Write readings as new part files, one per day they cover"""
+        with self.lock:
+            days = readings[self.time].dt.floor('D')
+            for day, part in readings.groupby(days, sort=True):
+                part = part.astype({self.city: str}).sort_values([self.city, self.time])
+                day_dir = self._day_dir(day)
+                day_dir.mkdir(exist_ok=True)
+                
+                path = day_dir / f"part-{part[self.time].min():%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+                tmp = path.with_suffix('.tmp')
+                pq.write_table(pa.Table.from_pandas(part, preserve_index=False), tmp)
+                os.replace(tmp, path)
+
+    def compact(self, day):
+        """Merge the part files of one day into a single file sorted by city and time"""
+        with self.lock:
+            parts = sorted(self._day_dir(day).glob('*.parquet'))
+            if len(parts) < 2:
+                return
+            table = ds.dataset(parts, format='parquet').to_table()
+            table = table.sort_by([(self.city, 'ascending'), (self.time, 'ascending')])
+            
+            path = self._day_dir(day) / f"day-{uuid.uuid4().hex[:8]}.parquet"
+            tmp = path.with_suffix('.tmp')
+            pq.write_table(table, tmp)
+            with self._swap:
+                os.replace(tmp, path)
+                for part in parts:
+                    part.unlink()
+
+    def compact_month(self, month):
+        """Fold the day partitions of one month into a single month partition"""
+        with self.lock:
+            month = pd.Timestamp(month).to_period('M')
+            day_dirs = [self._day_dir(day) for day in self.days(month.start_time, month.end_time)]
+            month_dir = self._month_dir(month.start_time)
+            sources = [path for folder in [month_dir] + day_dirs for path in folder.glob('*.parquet')]
+            if not day_dirs or not sources:
+                return
+            
+            table = ds.dataset(sources, format='parquet').to_table()
+            table = table.sort_by([(self.city, 'ascending'), (self.time, 'ascending')])
+            month_dir.mkdir(exist_ok=True)
+            path = month_dir / f"month-{uuid.uuid4().hex[:8]}.parquet"
+            tmp = path.with_suffix('.tmp')
+            pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+            with self._swap:
+                os.replace(tmp, path)
+                for source in sources:
+                    source.unlink()
+                for folder in day_dirs:
+                    folder.rmdir()
+
+    def read(self, cities=None, start=None, end=None, columns=None):
+        """Readings for the given cities with start <= time <= end.
+
+        columns limits the Parquet columns read; the city and time columns are
+        always included. The city comes back categorical and the readings with
+        READING_DTYPES, whatever width older files were written with. Like
+        scan(), the files are opened before they are read, so a compaction
+        replacing them meanwhile does not fail the read.
+        """
+        columns = self._columns(columns)
+        files = self._open(start, end)
+        if not files:
+            return pd.DataFrame(columns=columns or [self.city, self.time])
+        try:
+            fragments = [ds.ParquetFileFormat().make_fragment(file) for file in files]
+            dataset = ds.FileSystemDataset(fragments, fragments[0].physical_schema, ds.ParquetFileFormat())
+            table = dataset.to_table(columns=columns, filter=self._condition(cities, start, end))
+        finally:
+            for file in files:
+                file.close()
+        frame = table.to_pandas(strings_to_categorical=True)
+        frame = frame.astype({column: dtype for column, dtype in READING_DTYPES.items() if column in frame})
+        return frame.sort_values([self.city, self.time], ignore_index=True)
+
+    def scan(self, cities=None, start=None, end=None, columns=None, batch_size=SCAN_BATCH_SIZE):
+        """Readings like read(), as a stream of Arrow record batches.
+
+        Batches come a row group at a time, partitions oldest first, and are
+        not sorted across files, so memory stays around one row group
+        whatever the range; row groups whose statistics rule them out are
+        skipped. Every file of the range is opened before the first batch,
+        which makes the scan a consistent snapshot even if a compaction
+        replaces files while it runs.
+        """
+        columns = self._columns(columns)
+        condition = self._condition(cities, start, end)
+        files = self._open(start, end)
+        try:
+            for file in files:
+                # One row group at a time: the threaded scanner reads ahead without
+                # bound when the consumer is slower than the disk
+                fragment = ds.ParquetFileFormat().make_fragment(file)
+                for row_group in fragment.split_by_row_group(condition):
+                    yield from row_group.to_table(columns=columns, filter=condition).to_batches(batch_size)
+        finally:
+            for file in files:
+                file.close()
+
+    def _open(self, start, end):
+        """Open handles on every file of the partitions overlapping [start, end].
+
+        Compactions in this process wait until the files are open. One in
+        another process can still remove files or whole day folders after
+        they are listed; the range is then listed again.
+        """
+        while True:
+            files = []
+            try:
+                with self._swap:
+                    for _, folder in self._partitions(start, end):
+                        paths = sorted(folder.glob('*.parquet'))
+                        if not paths and not folder.exists():
+                            raise FileNotFoundError(folder)
+                        for path in paths:
+                            files.append(pa.OSFile(str(path)))
+                return files
+            except FileNotFoundError:
+                # Compacted between listing and opening; list the range again
+                for file in files:
+                    file.close()
+
+    def _columns(self, columns):
+        if columns is None:
+            return None
+        return [self.city, self.time] + [c for c in columns if c not in (self.city, self.time)]
+
+    def _condition(self, cities, start, end):
+        condition = None
+        for clause in (
+            ds.field(self.city).isin(list(cities)) if cities is not None else None,
+            ds.field(self.time) >= pd.Timestamp(start) if start is not None else None,
+            ds.field(self.time) <= pd.Timestamp(end) if end is not None else None,
+        ):
+            if clause is not None:
+                condition = clause if condition is None else condition & clause
+        return condition
+
+    def first_time(self):
+        """Timestamp of the oldest reading, or None for an empty store"""
+        for _, folder in self._partitions():
+            files = sorted(folder.glob('*.parquet'))
+            if files:
+                times = ds.dataset(files, format='parquet').to_table(columns=[self.time])[self.time]
+                if len(times):
+                    return pd.Timestamp(pc.min(times).as_py())
+        return None
+
+    def last_time(self):
+        """Timestamp of the newest reading, or None for an empty store"""
+        for _, folder in reversed(self._partitions()):
+            files = sorted(folder.glob('*.parquet'))
+            if files:
+                times = ds.dataset(files, format='parquet').to_table(columns=[self.time])[self.time]
+                if len(times):
+                    return pd.Timestamp(pc.max(times).as_py())
+        return None
@@ -0,0 +1,399 @@
+"""Seeded synthetic sensor stream for load and soak testing.
+
+SensorStream emits readings for any number of stations, tick after tick, as
+DataFrames with the columns of an ingested batch (city, station, time, AQI
+and the pollutants). Each station follows its city's base AQI through the
+dashboard's diurnal traffic multipliers and pollutant ratios, with on top:
+
+- seasonality, peaking in mid-January north of the equator and mid-July
+  south of it;
+- a slow per-station drift and per-reading noise on every pollutant;
+- spikes that start at random and decay over a few ticks;
+- sensor dropouts: outages during which a station sends nothing, and single
+  pollutant channels missing from a reading.
+
+The same seed, start and block size give the same stream. Concentrations are
+kept in integer tenths while they are generated, so the AQI is a lookup in
+per-pollutant sub-index tables rather than an interpolation; the tables are
+built from the float32 values the stream emits, so recomputing the AQI of a
+row with aqi_from_array gives its AQI column. One core produces several
+million readings per second. Streams can be paced to a target rate and written to the reading
+store, an Arrow IPC stream on a local socket, an in-process queue or files:
+
+    python aqi_stream.py bench --stations 100000 --seconds 10
+    python aqi_stream.py store --stations 5000 --hours 720
+    python aqi_stream.py listen --port 8767 &
+    python aqi_stream.py socket --port 8767 --stations 100000 --rate 2000000 --seconds 60
+    python aqi_stream.py files soak/ --format parquet --stations 100000 --ticks 1000
+"""
+import argparse
+import math
+import os
+import socket
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from aqi_compute import POLLUTANTS, STANDARDS, aqi_from_array, sub_index
+from aqi_data import (AQI_STANDARD, CITY_REGISTRY_PATH, DATA_DIR, HOURLY_MULTIPLIERS, POLLUTANT_RATIOS,
+                      load_city_registry)
+from aqi_export import FORMATS, encode
+
+STREAM_BLOCK_ROWS = 1 << 20
+STREAM_PORT = 8767
+SEASONAL_AMPLITUDE = 0.25
+SEASONAL_PEAK_DAY = 15
+DRIFT_PERSISTENCE = 0.97    # per tick; the drift is an AR(1) process in log space
+DRIFT_SCALE = 0.03
+READING_NOISE = 0.05        # each pollutant varies by up to ±5% around the station's level
+SPIKE_RATE = 2e-4           # chance per station and tick that a spike starts
+SPIKE_SIZE = (1.0, 3.0)     # a spike adds this many times the level, then decays
+SPIKE_DECAY = 0.6
+DROPOUT_RATE = 2e-5         # chance per station and tick that an outage starts
+DROPOUT_TICKS = 12          # mean outage length
+CHANNEL_DROPOUT_RATE = 1e-3 # chance per pollutant reading that it is missing
+
+def stream_stations(cities, n_stations, seed=0):
+    """n_stations simulated stations assigned to the registry's cities in turn"""
+    rng = np.random.default_rng(seed)
+    city = np.arange(n_stations) % len(cities)
+    names = cities.index.to_numpy(dtype=str)
+    number = (np.arange(n_stations) // len(cities) + 1).astype(str)
+    return pd.DataFrame({
+        'station': np.char.add(np.char.add(names[city], ' #'), number),
+        'city': pd.Categorical.from_codes(city, cities.index),
+        'base_aqi': (cities['base_aqi'].to_numpy(dtype=np.float32)[city]
+                     * rng.uniform(0.8, 1.35, n_stations).astype(np.float32)),
+        'lat': cities['lat'].to_numpy(dtype=np.float32)[city],
+    })
+
+def tenths_to_concentration(tenths):
+    """float32 concentrations of integer tenths, exactly as the stream emits them"""
+    concentrations = tenths.astype(np.float32)
+    concentrations *= np.float32(0.1)
+    return concentrations
+
+def subindex_tables(standard=AQI_STANDARD):
+    """Rounded sub-index of every concentration in tenths, past the top breakpoint, per pollutant.
+
+    Entries are sub_index() of the emitted float32 concentration with the
+    rounding aqi_from_array applies, so a lookup gives the AQI that
+    aqi_from_array computes from the stream's own columns; tenths beyond
+    the table are at the top of the scale, as its last entry is.
+    """
+    tables = []
+    for pollutant in POLLUTANTS:
+        breakpoints, _, scale = STANDARDS[standard]['pollutants'][pollutant]
+        tenths = np.arange(math.ceil(breakpoints[-1] / scale * 10) + 2)
+        tables.append(np.rint(sub_index(tenths_to_concentration(tenths), pollutant, standard)).astype(np.int16))
+    return tables
+
+class SensorStream:
+    """Readings of a fixed set of stations, one tick of every station after another.
+
+    stations is a frame like stream_stations() returns. The stream's state
+    (time, drift, decaying spikes and ongoing outages) carries from one
+    block to the next; the same seed and block sizes give the same readings.
+    """
+
+    def __init__(self, stations, start=None, step='1h', seed=0, standard=AQI_STANDARD,
+                 spike_rate=SPIKE_RATE, dropout_rate=DROPOUT_RATE, channel_dropout_rate=CHANNEL_DROPOUT_RATE):
+        self.step = pd.Timedelta(step)
+        self.time = pd.Timestamp(start) if start is not None else pd.Timestamp(datetime.now()).floor(self.step)
+        self.standard = standard
+        self.spike_rate = spike_rate
+        self.dropout_rate = dropout_rate
+        self.channel_dropout_rate = channel_dropout_rate
+        self.rng = np.random.default_rng(seed)
+
+        n = len(stations)
+        self._station = pd.CategoricalDtype(stations['station'].astype(str))
+        self._city = pd.Categorical(stations['city'])
+        self._base = stations['base_aqi'].to_numpy(dtype=np.float32)
+        self._hemisphere = np.where(stations['lat'].to_numpy() < 0, -1, 1).astype(np.float32)
+        self._drift = np.zeros(n, dtype=np.float32)
+        self._spike = np.zeros(n, dtype=np.float32)
+        self._offline_ticks = np.zeros(n, dtype=np.int64)    # ticks of an ongoing outage still to come
+        self._tables = subindex_tables(standard)
+
+    def __len__(self):
+        return len(self._base)
+
+    def _levels(self, times):
+        """(ticks, stations) pollutant level: base AQI through the daily and yearly cycles, drift and spikes"""
+        hours = (times - times.normalize()) / pd.Timedelta(hours=1)
+        daily = np.interp(hours, np.arange(25), np.append(HOURLY_MULTIPLIERS, HOURLY_MULTIPLIERS[0]))
+        days = times.dayofyear + hours / 24
+        yearly = np.cos(2 * np.pi * (days - SEASONAL_PEAK_DAY) / 365.25)
+        season = 1 + SEASONAL_AMPLITUDE * yearly.to_numpy(dtype=np.float32)[:, None] * self._hemisphere
+        levels = self._base * daily.astype(np.float32)[:, None] * season
+
+        shocks = self.rng.standard_normal(levels.shape, dtype=np.float32) * DRIFT_SCALE
+        spikes = self.rng.random(levels.shape, dtype=np.float32) < self.spike_rate
+        for tick in range(len(times)):
+            self._drift *= DRIFT_PERSISTENCE
+            self._drift += shocks[tick]
+            self._spike *= SPIKE_DECAY
+            started = np.flatnonzero(spikes[tick])
+            self._spike[started] += self.rng.uniform(*SPIKE_SIZE, len(started)).astype(np.float32)
+            shocks[tick] = np.exp(self._drift) * (1 + self._spike)
+        return levels * shocks
+
+    def _online(self, ticks):
+        """(ticks, stations) mask of the stations that report, or None when they all do"""
+        n = len(self)
+        ongoing = self._offline_ticks > 0
+        starts = self.rng.binomial(ticks * n, self.dropout_rate)
+        if not ongoing.any() and not starts:
+            return None
+        offline = np.arange(ticks)[:, None] < self._offline_ticks
+        self._offline_ticks = np.maximum(self._offline_ticks - ticks, 0)
+        for position in self.rng.choice(ticks * n, starts, replace=False):
+            tick, station = divmod(int(position), n)
+            length = int(self.rng.geometric(1 / DROPOUT_TICKS))
+            offline[tick:tick + length, station] = True
+            self._offline_ticks[station] = max(self._offline_ticks[station], tick + length - ticks)
+        return ~offline
+
+    def block(self, ticks=1):
+        """DataFrame of the next ticks ticks, one row per reporting station and tick"""
+        n = len(self)
+        times = pd.date_range(self.time, periods=ticks, freq=self.step)
+        self.time += ticks * self.step
+        levels = self._levels(times).reshape(-1)
+
+        size = levels.size
+        noise = self.rng.random((len(POLLUTANTS), size), dtype=np.float32)
+        noise *= 2 * READING_NOISE
+        noise += 1 - READING_NOISE
+        tenths = np.empty((len(POLLUTANTS), size), dtype=np.int32)
+        aqi = np.zeros(size, dtype=np.int16)
+        for i, (ratio, table) in enumerate(zip(POLLUTANT_RATIOS, self._tables)):
+            scaled = np.multiply(noise[i], np.float32(ratio * 10), out=noise[i])
+            scaled *= levels
+            np.rint(scaled, out=scaled)
+            tenths[i] = scaled
+            np.maximum(aqi, table.take(tenths[i], mode='clip'), out=aqi)
+        concentrations = tenths_to_concentration(tenths)
+
+        missing = self.rng.binomial(concentrations.size, self.channel_dropout_rate)
+        if missing:
+            positions = self.rng.choice(concentrations.size, missing, replace=False)
+            concentrations.reshape(-1)[positions] = np.nan
+            rows = np.unique(positions % size)
+            aqi[rows] = aqi_from_array(concentrations[:, rows].T, POLLUTANTS, self.standard)
+
+        station = np.tile(np.arange(n, dtype=np.int32), ticks)
+        time_values = np.repeat(times.to_numpy(), n)
+        online = self._online(ticks)
+        if online is not None:
+            keep = online.reshape(-1)
+            station, time_values, aqi = station[keep], time_values[keep], aqi[keep]
+            concentrations = concentrations[:, keep]
+
+        frame = pd.DataFrame({
+            'city': pd.Categorical.from_codes(self._city.codes[station], dtype=self._city.dtype),
+            'station': pd.Categorical.from_codes(station, dtype=self._station),
+            'time': time_values,
+            'AQI': aqi,
+            **dict(zip(POLLUTANTS, concentrations)),
+        })
+        return frame
+
+    def blocks(self, ticks=None, seconds=None, rate=None, block_rows=STREAM_BLOCK_ROWS):
+        """Blocks of whole ticks, of up to block_rows rows, paced to rate readings per second if given.
+
+        Stops after ticks ticks or seconds seconds of wall time, whichever
+        comes first, and runs forever with neither.
+        """
+        per_block = max(1, block_rows // len(self))
+        if rate:
+            # Keep each block to about a tenth of a second of output, so pacing stays smooth
+            per_block = min(per_block, max(1, int(rate / 10 / len(self))))
+        started = time.perf_counter()
+        emitted = 0
+        remaining = ticks
+        while remaining is None or remaining > 0:
+            if seconds is not None and time.perf_counter() - started >= seconds:
+                return
+            count = per_block if remaining is None else min(per_block, remaining)
+            frame = self.block(count)
+            yield frame
+            emitted += len(frame)
+            if remaining is not None:
+                remaining -= count
+            if rate:
+                delay = started + emitted / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+def record_batches(blocks):
+    for frame in blocks:
+        yield pa.RecordBatch.from_pandas(frame, preserve_index=False)
+
+def write_store(blocks, store, flush_rows=STREAM_BLOCK_ROWS):
+    """Append blocks to a ReadingStore, flush_rows rows per append; returns the rows written"""
+    pending, rows, written = [], 0, 0
+    for frame in blocks:
+        pending.append(frame)
+        rows += len(frame)
+        if rows >= flush_rows:
+            store.append(pd.concat(pending, ignore_index=True))
+            pending, written, rows = [], written + rows, 0
+    if pending:
+        store.append(pd.concat(pending, ignore_index=True))
+    return written + rows
+
+def write_queue(blocks, queue):
+    """Put blocks on a queue, then None; a bounded queue holds the stream back to its consumer's pace"""
+    written = 0
+    for frame in blocks:
+        queue.put(frame)
+        written += len(frame)
+    queue.put(None)
+    return written
+
+def connect(address):
+    """Socket connected to host:port, or to a Unix socket path"""
+    if ':' not in address:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        return sock
+    host, _, port = address.rpartition(':')
+    return socket.create_connection((host or '127.0.0.1', int(port)))
+
+def write_socket(blocks, address, fmt='arrow'):
+    """Send blocks to a socket as one stream in one of the export FORMATS; returns the rows written"""
+    written = 0
+
+    def counted():
+        nonlocal written
+        for batch in record_batches(blocks):
+            written += batch.num_rows
+            yield batch
+
+    with connect(address) as sock:
+        for chunk in encode(counted(), fmt):
+            sock.sendall(chunk)
+    return written
+
+def write_files(blocks, directory, fmt='parquet', rotate_rows=10 * STREAM_BLOCK_ROWS):
+    """Write blocks to numbered files of about rotate_rows rows each; returns the rows written"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    written, part, pending, rows = 0, 0, [], 0
+
+    def flush():
+        path = directory / f"readings-{part:05d}.{fmt}"
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as output:
+            for chunk in encode(record_batches(pending), fmt):
+                output.write(chunk)
+        os.replace(tmp, path)
+
+    for frame in blocks:
+        if pending and rows + len(frame) > rotate_rows:
+            flush()
+            part, pending, written, rows = part + 1, [], written + rows, 0
+        pending.append(frame)
+        rows += len(frame)
+    if pending:
+        flush()
+    return written + rows
+
+def _stream(args):
+    cities = load_city_registry(args.cities)
+    stations = stream_stations(cities, args.stations, args.seed)
+    start = args.start
+    if start is None and args.command == 'store':
+        start = pd.Timestamp(datetime.now()).floor('h') - args.hours * pd.Timedelta(args.step)
+    stream = SensorStream(stations, start, args.step, args.seed)
+    ticks = args.hours if args.command == 'store' and args.ticks is None else args.ticks
+    block_rows = min(STREAM_BLOCK_ROWS, args.rotate_rows) if args.command == 'files' else STREAM_BLOCK_ROWS
+    return stream.blocks(ticks, args.seconds, args.rate, block_rows)
+
+def _run(args):
+    started = time.perf_counter()
+    blocks = _stream(args)
+    if args.command == 'bench':
+        written = sum(len(frame) for frame in blocks)
+    elif args.command == 'store':
+        from aqi_store import ReadingStore
+        written = write_store(blocks, ReadingStore(Path(args.data_dir) / 'readings'))
+    elif args.command == 'socket':
+        written = write_socket(blocks, args.address or f'127.0.0.1:{args.port}', args.format)
+    else:
+        written = write_files(blocks, args.directory, args.format, args.rotate_rows)
+    elapsed = time.perf_counter() - started
+    print(f"{written:,} readings of {args.stations:,} stations in {elapsed:.2f}s "
+          f"({written / elapsed / 1e6:.2f}M readings/s)", file=sys.stderr)
+
+def _listen(args):
+    """Accept Arrow IPC streams one after another and report the rate each one arrives at"""
+    if args.address and ':' not in args.address:
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(args.address)
+    else:
+        server = socket.create_server(('127.0.0.1', args.port))
+    server.listen()
+    print(f"Listening on {args.address or f'127.0.0.1:{args.port}'}", file=sys.stderr)
+    with server:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile('rb') as stream:
+                started = reported = time.perf_counter()
+                rows = since = 0
+                for batch in ipc.open_stream(stream):
+                    rows += batch.num_rows
+                    now = time.perf_counter()
+                    if now - reported >= 1:
+                        print(f"{(rows - since) / (now - reported) / 1e6:.2f}M readings/s", file=sys.stderr)
+                        reported, since = now, rows
+                elapsed = time.perf_counter() - started
+                print(f"received {rows:,} readings in {elapsed:.2f}s", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', default=CITY_REGISTRY_PATH, help='city registry, CSV or Parquet')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    outputs = {
+        'bench': 'generate readings without writing them and report the rate',
+        'store': 'write readings to the reading store, by default the last --hours hours',
+        'socket': 'send readings as an Arrow IPC (or CSV) stream to a local socket',
+        'files': 'write readings to numbered files',
+    }
+    for name, description in outputs.items():
+        command = commands.add_parser(name, help=description)
+        command.add_argument('--stations', type=int, default=10000)
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--start', help='time of the first tick (default now)')
+        command.add_argument('--step', default='1h', help='time between ticks, as a pandas timedelta')
+        command.add_argument('--ticks', type=int, help='number of ticks (default unlimited)')
+        command.add_argument('--seconds', type=float, help='stop after this many seconds')
+        command.add_argument('--rate', type=float, help='readings per second (default as fast as possible)')
+    commands.choices['bench'].set_defaults(seconds=10.0)
+    commands.choices['store'].add_argument('--hours', type=int, default=24)
+    commands.choices['store'].add_argument('--data-dir', default=DATA_DIR)
+    commands.choices['socket'].add_argument('--port', type=int, default=STREAM_PORT)
+    commands.choices['socket'].add_argument('--address', help='host:port or Unix socket path (default localhost)')
+    commands.choices['socket'].add_argument('--format', default='arrow', choices=['arrow', 'csv'])
+    commands.choices['files'].add_argument('directory')
+    commands.choices['files'].add_argument('--format', default='parquet', choices=list(FORMATS))
+    commands.choices['files'].add_argument('--rotate-rows', type=int, default=10 * STREAM_BLOCK_ROWS)
+
+    listen = commands.add_parser('listen', help='receive Arrow IPC streams and report their rate')
+    listen.add_argument('--port', type=int, default=STREAM_PORT)
+    listen.add_argument('--address', help='Unix socket path (default localhost:port)')
+
+    args = parser.parse_args(argv)
+    {'listen': _listen}.get(args.command, _run)(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from aqi_alerts import AlertEngine, alert_entities
+from aqi_data import station_hourly_aqi
+
+def _entities(aqi):
+    return pd.DataFrame({'kind': 'station', 'name': 'A', 'city': 'X', 'aqi': [aqi]}, index=['station:X/A'])
+
+def test_repeated_refresh_does_not_advance_debounce():
+    engine = AlertEngine()
+    assert engine.evaluate(_entities(150.0), now=0, key=('day', 10)).empty
+    assert engine.evaluate(_entities(150.0), now=900, key=('day', 10)).empty
+    assert engine.active().empty
+
+def test_debounce_fires_on_the_next_refresh():
+    engine = AlertEngine()
+    engine.evaluate(_entities(150.0), now=0, key=('day', 10))
+    alerts = engine.evaluate(_entities(150.0), now=3600, key=('day', 11))
+    assert list(zip(alerts['id'], alerts['rule'], alerts['status'])) == [('station:X/A', 'unhealthy', 'firing')]
+
+def _refresh(engine, city_aqi, previous, key):
+    cities = pd.DataFrame({'base_aqi': [100]}, index=['X'])
+    stations = pd.DataFrame({'name': ['A'], 'city': ['X'], 'aqi': [120]})
+    stations = stations.assign(aqi=station_hourly_aqi(stations, cities, [city_aqi]),
+                               previous=station_hourly_aqi(stations, cities, [previous]))
+    alerts = engine.evaluate(alert_entities(stations), now=key * 3600, key=key)
+    return set(zip(alerts['rule'], alerts['status'])) if len(alerts) else set()
+
+def test_station_alerts_follow_their_city_hour_by_hour():
+    engine = AlertEngine()
+    assert _refresh(engine, 50, 50, 1) == set()
+    # The city rises by 100, so the station (1.2x its city) rises by 120 to 180
+    assert _refresh(engine, 150, 50, 2) == {('rapid_rise', 'firing')}
+    assert _refresh(engine, 150, 150, 3) == {('unhealthy', 'firing'), ('rapid_rise', 'resolved')}
+    assert _refresh(engine, 60, 150, 4) == {('unhealthy', 'resolved')}
+
+def test_stations_outside_the_registry_keep_their_catalogue_aqi():
+    cities = pd.DataFrame({'base_aqi': [100]}, index=['X'])
+    stations = pd.DataFrame({'name': ['A', 'B'], 'city': ['X', 'Y'], 'aqi': [120, 90]})
+    np.testing.assert_array_equal(station_hourly_aqi(stations, cities, [50]), [60, 90])
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import make_mocked_request
+
+from aqi_api import AqiApi
+from aqi_data import CITY_REGISTRY_PATH, hour_bucket, load_city_registry, time_bucket
+
+@pytest.fixture(scope='module')
+def api():
+    return AqiApi(load_city_registry(CITY_REGISTRY_PATH))
+
+async def _get(api, *paths):
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        async with ClientSession() as session:
+            responses = []
+            for path in paths:
+                async with session.get(f'http://127.0.0.1:{port}{path}') as response:
+                    responses.append((response.status, await response.json()))
+            return responses
+    finally:
+        await runner.cleanup()
+
+def test_comparison_ranks_every_city_and_station(api):
+    (status, body), = asyncio.run(_get(api, '/v1/comparison?size=10'))
+    assert status == 200
+    assert body['summary']['count'] == len(api.ranking) == len(api.cities) + len(api.stations)
+    aqi = [row['aqi'] for row in body['locations']]
+    assert [row['rank'] for row in body['locations']] == list(range(1, 11))
+    assert aqi == sorted(aqi, reverse=True)
+    assert body['locations'][0]['label'] == body['summary']['highest']['label']
+
+def test_comparison_filters_and_rejects_bad_queries(api):
+    (status, stations), (bad_kind, _), (bad_size, _) = asyncio.run(_get(
+        api, '/v1/comparison?kind=station&order=clean&page=2&size=5', '/v1/comparison?kind=river',
+        '/v1/comparison?size=0'))
+    assert status == 200
+    assert {row['kind'] for row in stations['locations']} == {'station'}
+    assert [row['rank'] for row in stations['locations']] == list(range(6, 11))
+    assert (bad_kind, bad_size) == (400, 400)
+
+def test_responses_from_the_previous_days_snapshot_are_not_cached(api):
+    now = datetime(2025, 1, 2, 0, 5)
+    api.snapshots.get((api.source, time_bucket(now - timedelta(days=1))))
+    request = make_mocked_request('GET', '/v1/cities')
+    key = ('response', request.path_qs, api.source, hour_bucket(now))
+    # Another request is building the new day's snapshot
+    with api.snapshots._lock:
+        stale = api._respond(key, api.cities_payload, request, now)
+    assert api.cache.get(key) is None
+    assert stale.expires <= time.time()
+    fresh = api._respond(key, api.cities_payload, request, now)
+    assert api.cache.get(key) is fresh and fresh.body != stale.body
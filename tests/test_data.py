@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from aqi_data import (CITY_REGISTRY_PATH, city_readings, compute_metrics, generate_forecasts, load_city_registry,
+                      station_catalogue)
+from aqi_rank import Ranking, location_ids, ranking_locations
+from aqi_store import ReadingStore
+
+def _store(tmp_path, name, aqi):
+    hours = pd.date_range('2025-01-01', periods=48, freq='h')
+    store = ReadingStore(tmp_path / name)
+    store.append(pd.DataFrame({'city': 'Delhi', 'station': 'A', 'time': hours,
+                               'AQI': (100 + 20 * np.sin(np.arange(48) / 4)).astype('int16')}))
+    if aqi is not None:
+        store.append(pd.DataFrame({'city': 'Delhi', 'station': 'B', 'time': hours, 'AQI': np.int16(aqi)}))
+    return store
+
+def test_forecasts_leave_out_readings_without_an_aqi(tmp_path):
+    now = pd.Timestamp('2025-01-02 23:00')
+    with_missing = generate_forecasts(_store(tmp_path, 'missing', -1), ['Delhi'], now)
+    alone = generate_forecasts(_store(tmp_path, 'alone', None), ['Delhi'], now)
+    pd.testing.assert_frame_equal(with_missing, alone)
+
+def test_metrics_rank_cities_like_the_dashboard_ranking():
+    cities = load_city_registry(CITY_REGISTRY_PATH)
+    metrics = compute_metrics(cities, '2025-01-01', 9, workers=1)
+    ranking = Ranking(ranking_locations(cities, station_catalogue(cities)[0]))
+    ranking.update(pd.Series(city_readings(cities, '2025-01-01')[:, 9, 0], index=location_ids('city', cities.index)))
+    ranked = ranking.page(0, len(cities), kind='city')
+    assert list(metrics.sort_values('comparison_rank').index) == list(ranked['city'].astype(str))
@@ -0,0 +1,25 @@
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+from aqi_export import export_range, export_server
+
+def test_export_server_binds_loopback_and_caps_the_range():
+    server = export_server(None, None, pd.Index(['Delhi']), port=0)
+    try:
+        host, port = server.server_address[:2]
+        assert host == '127.0.0.1'
+        url = f'http://{host}:{port}/export/aqi.csv?city=Delhi&start=2023-01-01&end=2025-12-31'
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url, timeout=5)
+        assert error.value.code == 400
+        assert b'at most' in error.value.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_export_range_allows_a_full_year():
+    start, end = export_range('2024-01-01', '2024-12-31', max_days=366)
+    assert end - start == pd.Timedelta(days=365, hours=23)
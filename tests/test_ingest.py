@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from aiohttp import web
+
+from aqi_ingest import Ingestor, Source, normalize_reading
+
+async def _poll_with_bad_station():
+    async def station(request):
+        if request.match_info['station'] == 'BAD':
+            return web.json_response({'pollutants': {'pm25': 'n/a', 'pm10': 80}})
+        if request.match_info['station'] == 'BADTIME':
+            return web.json_response({'time': [2025, 1, 1], 'pollutants': {'pm25': 40, 'pm10': 80}})
+        return web.json_response({'time': '2025-01-01T10:20:00',
+                                  'pollutants': {'pm25': 40, 'pm10': 80, 'no2': 20}})
+
+    app = web.Application()
+    app.router.add_get('/stations/{station}', station)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    frames = []
+    stations = [{'id': 'A', 'city': 'Delhi'}, {'id': 'BAD', 'city': 'Delhi'}, {'id': 'BADTIME', 'city': 'Delhi'},
+                {'id': 'B', 'city': 'Mumbai'}]
+    ingestor = Ingestor([Source('test', f'http://127.0.0.1:{port}/stations/{{station}}', stations)], frames.append)
+    try:
+        stats = await ingestor.poll()
+    finally:
+        await ingestor.close()
+        await runner.cleanup()
+    return stats, ingestor.invalid, frames
+
+def test_bad_payload_is_counted_and_other_stations_are_written():
+    stats, invalid, frames = asyncio.run(_poll_with_bad_station())
+    assert stats['invalid'] == 2 and stats['written'] == 2
+    assert invalid == {'BAD': 1, 'BADTIME': 1}
+    assert sorted(frames[0]['station']) == ['A', 'B']
+
+@pytest.mark.parametrize('time', [[2025, 1, 1], True, {'hour': 10}, float('nan'), 1e30, 'yesterday-ish', 'NaT'])
+def test_unparseable_times_are_rejected(time):
+    with pytest.raises(ValueError):
+        normalize_reading({'time': time, 'pm25': 40}, {'id': 'A', 'city': 'Delhi'})
+
+def test_zoned_and_epoch_times_are_the_same_local_hour():
+    station = {'id': 'A', 'city': 'Delhi'}
+    times = [normalize_reading({'time': time, 'pm25': 40}, station)['time']
+             for time in ('2025-01-01T10:20:00+05:30', '2025-01-01T04:50:00Z', 1735707000, 1735707000.5)]
+    assert len(set(times)) == 1
+    local = datetime.now().astimezone().tzinfo
+    expected = pd.Timestamp('2025-01-01T04:50:00Z').tz_convert(local).tz_localize(None).floor('h')
+    assert times[0] == expected
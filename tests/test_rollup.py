@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aqi_rollup import HIST_BIN, RollupStore, aggregate, merge, percentiles, stats
+from aqi_store import ReadingStore
+
+PERIODS = {'day': 'D', 'week': 'W-SUN', 'month': 'M'}
+
+def _readings(start='2025-01-20', hours=24 * 20, cities=('Delhi', 'London'), seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=hours, freq='h')
+    aqi = rng.integers(0, 500, len(cities) * hours).astype(float)
+    aqi[rng.random(len(aqi)) < 0.05] = -1    # too few pollutants for an AQI
+    return pd.DataFrame({'city': np.repeat(cities, hours), 'time': np.tile(times, len(cities)), 'AQI': aqi})
+
+def _expected(readings, level):
+    """count, sum, min and max per city and bucket, straight from pandas"""
+    valid = readings[readings['AQI'] >= 0]
+    start = valid['time'].dt.to_period(PERIODS[level]).dt.start_time
+    return (valid.groupby([valid['city'].astype(str), start])['AQI'].agg(['count', 'sum', 'min', 'max'])
+            .rename_axis(['city', 'start']).reset_index())
+
+def _frame(aggregates):
+    return pd.DataFrame({column: aggregates[column] for column in ('city', 'start', 'count', 'sum', 'min', 'max')})
+
+@pytest.mark.parametrize('level', ['day', 'week', 'month'])
+def test_aggregate_matches_a_groupby(level):
+    readings = _readings()
+    aggregates = aggregate(readings, level)
+    expected = _expected(readings, level)
+    pd.testing.assert_frame_equal(_frame(aggregates).astype({'city': str}), expected, check_dtype=False)
+    assert (aggregates['hist'].sum(axis=1) == aggregates['count']).all()
+
+def test_merge_of_parts_is_the_aggregate_of_the_whole():
+    readings = _readings()
+    parts = [aggregate(readings.iloc[i::3], 'week') for i in range(3)]
+    merged, whole = merge(*parts), aggregate(readings, 'week')
+    for column in whole:
+        np.testing.assert_array_equal(merged[column], whole[column])
+
+def test_percentiles_are_within_one_bin():
+    readings = _readings()
+    aggregates = aggregate(readings, 'month')
+    estimated = percentiles(aggregates['hist'], aggregates['min'], aggregates['max'])
+    valid = readings[readings['AQI'] >= 0]
+    for q in (50, 90, 95):
+        exact = valid.groupby([valid['city'], valid['time'].dt.to_period('M')])['AQI'].quantile(q / 100)
+        assert np.abs(estimated[f'p{q}'] - exact.to_numpy()).max() <= HIST_BIN
+
+def _rollups_match_store(rollups, store):
+    readings = store.read()
+    for level in ('day', 'week', 'month'):
+        got = stats(rollups.aggregates(None, '2000-01-01', '2100-01-01', level))
+        expected = _expected(readings, level)
+        assert list(zip(got['city'].astype(str), got['start'], got['count'])) == \
+            list(zip(expected['city'], expected['start'], expected['count']))
+        np.testing.assert_allclose(got['mean'], expected['sum'] / expected['count'])
+        np.testing.assert_array_equal(got['max'], expected['max'])
+
+def test_catch_up_folds_late_readings_and_compactions(tmp_path):
+    store = ReadingStore(tmp_path / 'readings')
+    rollups = RollupStore(store)
+    readings = _readings().astype({'AQI': 'int16'})
+    early, late = readings[readings['city'] == 'Delhi'], readings[readings['city'] == 'London']
+    store.append(early)
+    rollups.catch_up()
+    _rollups_match_store(rollups, store)
+
+    # London's readings arrive after Delhi's hours were folded, for the same hours
+    store.append(late)
+    rollups.catch_up()
+    _rollups_match_store(rollups, store)
+
+    for day in store.days():
+        store.compact(day)
+    store.compact_month('2025-01')
+    rollups.catch_up()
+    _rollups_match_store(rollups, store)
+
+def test_catch_up_after_a_lost_manifest_does_not_count_twice(tmp_path):
+    store = ReadingStore(tmp_path / 'readings')
+    rollups = RollupStore(store)
+    store.append(_readings().astype({'AQI': 'int16'}))
+    rollups.catch_up()
+    # As if the process died after writing the buckets but before recording the manifest
+    (rollups.root / 'folded.json').unlink()
+    rollups.catch_up()
+    _rollups_match_store(rollups, store)
@@ -0,0 +1,76 @@
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aqi_store import ReadingStore
+
+CITIES = ('Delhi', 'London', 'Paris')
+
+def _readings(start, hours):
+    times = pd.date_range(start, periods=hours, freq='h')
+    return pd.DataFrame({
+        'city': np.repeat(CITIES, len(times)),
+        'time': np.tile(times, len(CITIES)),
+        'AQI': np.arange(len(CITIES) * len(times), dtype=float),
+    })
+
+def _store(tmp_path, days):
+    """A store holding `days` days of readings, one part file per hour"""
+    store = ReadingStore(tmp_path)
+    readings = _readings('2025-01-01', 24 * days)
+    for _, hour in readings.groupby('time'):
+        store.append(hour)
+    return store, readings
+
+@pytest.fixture
+def slow_unlink(monkeypatch):
+    """Widen the window between a compaction writing its file and removing the old ones"""
+    unlink = Path.unlink
+
+    def slow(path, *args, **kwargs):
+        time.sleep(0.005)
+        unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(Path, 'unlink', slow)
+
+def _read_while(store, expected, work):
+    """Read the whole store until work() returns, checking every read sees each reading exactly once"""
+    errors = []
+
+    def run():
+        try:
+            work()
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    reads = 0
+    while thread.is_alive() or not reads:
+        frame = store.read()
+        assert len(frame) == expected
+        assert not frame.duplicated(['city', 'time']).any()
+        reads += 1
+    thread.join()
+    assert not errors
+
+def test_read_while_another_thread_compacts(tmp_path, slow_unlink):
+    store, readings = _store(tmp_path, 3)
+    _read_while(store, len(readings), lambda: [store.compact(day) for day in store.days()])
+    assert [len(list(store._day_dir(day).glob('*.parquet'))) for day in store.days()] == [1] * 3
+
+def test_read_while_another_thread_compacts_a_month(tmp_path, slow_unlink):
+    store, readings = _store(tmp_path, 3)
+
+    def compact():
+        store.compact('2025-01-01')
+        store.compact_month('2025-01')
+
+    _read_while(store, len(readings), compact)
+    assert store.days() == []
+    stored = store.read()
+    assert list(zip(stored['city'].astype(str), stored['time'])) == sorted(zip(readings['city'], readings['time']))
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from aqi_compute import POLLUTANTS, aqi_from_array
+from aqi_data import load_city_registry
+from aqi_stream import SensorStream, stream_stations
+
+@pytest.mark.parametrize('standard', ['IN', 'US'])
+def test_aqi_matches_aqi_from_array_on_emitted_concentrations(standard):
+    stations = stream_stations(load_city_registry(), 2000, seed=1)
+    stream = SensorStream(stations, '2025-01-01', seed=1, standard=standard, channel_dropout_rate=0.01)
+    frame = stream.block(24)
+    assert frame[POLLUTANTS].isna().any().any()
+    expected = aqi_from_array(frame[POLLUTANTS].to_numpy(dtype=float), POLLUTANTS, standard)
+    np.testing.assert_array_equal(frame['AQI'].to_numpy(), expected)